@@ -1,11 +1,7 @@
 import streamlit as st
 import folium
-from streamlit_folium import st_folium
-from avwx import Metar, Taf
-import math
-import re
-import io
-import os
+from streamlit_folium import st_folium, generate_leaflet_string
+import time
 import pandas as pd
 from datetime import datetime, timedelta, timezone
 
@@ -13,8 +9,6 @@ from datetime import datetime, timedelta, timezone
 st.set_page_config(layout="wide", page_title="BA OCC HUD", page_icon="✈️", initial_sidebar_state="expanded")
 
 # 2. IRONCLAD FULL-SCREEN CSS
-st.markdown('<meta http-equiv="refresh" content="900">', unsafe_allow_html=True)
-
 st.markdown("""
     <style>
     /* 1. HIDE ALL STREAMLIT MARGINS */
@@ -92,173 +86,76 @@ st.markdown("""
     
     /* 11. MAP POPUPS */
     .leaflet-tooltip, .leaflet-popup-content-wrapper { background: white !important; border: 2px solid #002366 !important; padding: 0 !important; opacity: 1 !important; }
+    
+    /* 12. ON-DEMAND STATION DETAIL (Light map mode, floats under the clock) */
+    .st-key-station_detail { position: fixed !important; top: 75px; right: 20px; width: 610px !important; z-index: 999997; max-height: calc(100vh - 100px); overflow-y: auto; box-shadow: 0 4px 10px rgba(0,0,0,0.5); border-radius: 5px; }
     </style>
 """, unsafe_allow_html=True)
 
-# 3. UTILITIES & ROBUST CSV LOADER
-def get_safe_num(val, default=0):
-    if val is None: return default
-    try: return float(val)
-    except (ValueError, TypeError): return default
-
-def calculate_dist(lat1, lon1, lat2, lon2):
-    R = 3440.065 
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi, dlambda = math.radians(lat2 - lat1), math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    return round(2 * R * math.atan2(math.sqrt(a), math.sqrt(1-a)), 1)
-
-def calculate_xwind(wind_dir, wind_spd, rwy_hdg):
-    if wind_dir is None or wind_spd is None or rwy_hdg is None: return 0
-    angle = math.radians(wind_dir - rwy_hdg)
-    return round(abs(wind_spd * math.sin(angle)))
-
-def bold_hazard(text):
-    if not text or text == "N/A": return text
-    text = re.sub(r'\b(TEMPO|BECMG|PROB\d{2})\b', r'<b>\1</b>', text)
-    text = re.sub(r'(\b\d{4}/\d{4}\b)', r'<b>\1</b>', text)
-    text = re.sub(r'(\b\d{3}\d{2}G\d{2,3}KT\b)', r'<b>\1</b>', text)
-    text = re.sub(r'(\b\d{3}[2-9]\dKT\b)', r'<b>\1</b>', text)
-    text = re.sub(r'(\b(FG|TSRA|SN|-SN|\+SN|FZRA|FZDZ|TS|FOG)\b)', r'<b>\1</b>', text)
-    text = re.sub(r'\b((?:BKN|OVC)00[0-9])\b', r'<b>\1</b>', text)
-    text = re.sub(r'\b((?:BKN|OVC)01[0-5])\b', r'<b>\1</b>', text)
-    text = re.sub(r'\b(0[0-9]{3})\b', r'<b>\1</b>', text)
-    return text
-
-@st.cache_data
-def load_schedule_robust(file_bytes):
-    try:
-        content = file_bytes.decode('utf-8').splitlines()
-        skip_r = 0
-        for i, line in enumerate(content):
-            if 'DATE' in line and 'FLT' in line and 'DEP' in line and 'ARR' in line:
-                skip_r = i
-                break
-        df = pd.read_csv(io.StringIO(file_bytes.decode('utf-8')), skiprows=skip_r, on_bad_lines='skip')
-        df = df.dropna(subset=['FLT'])
-        if 'DEP' in df.columns: df['DEP'] = df['DEP'].astype(str).str.strip().str.upper()
-        if 'ARR' in df.columns: df['ARR'] = df['ARR'].astype(str).str.strip().str.upper()
-        df['DATE_OBJ'] = pd.to_datetime(df['DATE'], format='%d/%m/%y', errors='coerce').dt.date
-        df['DATE_OBJ'] = df['DATE_OBJ'].fillna(pd.to_datetime(df['DATE'], dayfirst=True, errors='coerce').dt.date)
-        return df
-    except Exception as e:
-        return pd.DataFrame()
+# 3. PIPELINE (hud_engine.py) & PER-PROCESS CACHES
+# The weather/schedule/hazard pipeline lives in hud_engine so it can also run headless; the app only adds caching around the
+# pieces that should be built once per process or once per input. Singletons stay in st.cache_resource; anything keyed by
+# data (schedule versions, snapshots, views) goes through the engine's size-aware memory budget instead.
+from hud_engine import (metrics, memory, get_safe_num, best_runway, scan_hazards, bold_hazard, ScheduleStore, airport_fleet, ScheduleIndex,
+                        AirportDB, load_network, AlternatesIndex, REFRESH_INTERVAL, WeatherRefresher,
+                        HANDOVER_WINDOW_HOURS, HZ_AT_RISK, HazardTable, process_weather_for_horizon, FLIGHT_STATUS_ENABLED,
+                        FlightStatusPoller, AlertBoard, handover_text, RED, AMBER, GREEN)
+
+@st.cache_resource
+def get_schedule_store():
+    return ScheduleStore()
+
+schedule_store = get_schedule_store()
+
+def load_schedule_robust(store, schedule_hash):
+    return memory.get_or_build("schedule", schedule_hash, lambda: store.frame(schedule_hash))
+
+def get_schedule_index(df, schedule_hash, ops_date):
+    return memory.get_or_build("schedule_index", (schedule_hash, ops_date), lambda: ScheduleIndex(df))
+
 
 # 4. MASTER DATABASE
-base_airports = {
-    "LCY": {"icao": "EGLC", "lat": 51.505, "lon": 0.055, "rwy": 270, "fleet": "Cityflyer", "spec": True},
-    "AMS": {"icao": "EHAM", "lat": 52.313, "lon": 4.764, "rwy": 180, "fleet": "Cityflyer", "spec": False},
-    "EDI": {"icao": "EGPH", "lat": 55.950, "lon": -3.363, "rwy": 240, "fleet": "Cityflyer", "spec": False},
-    "GLA": {"icao": "EGPF", "lat": 55.871, "lon": -4.433, "rwy": 230, "fleet": "Both", "spec": False},
-    "BHD": {"icao": "EGAC", "lat": 54.618, "lon": -5.872, "rwy": 220, "fleet": "Cityflyer", "spec": False},
-    "STN": {"icao": "EGSS", "lat": 51.885, "lon": 0.235, "rwy": 220, "fleet": "Cityflyer", "spec": False},
-    "RTM": {"icao": "EHRD", "lat": 51.957, "lon": 4.440, "rwy": 240, "fleet": "Cityflyer", "spec": False},
-    "DUB": {"icao": "EIDW", "lat": 53.421, "lon": -6.270, "rwy": 280, "fleet": "Cityflyer", "spec": False},
-    "FLR": {"icao": "LIRQ", "lat": 43.810, "lon": 11.205, "rwy": 50, "fleet": "Cityflyer", "spec": True},
-    "CMF": {"icao": "LFLB", "lat": 45.638, "lon": 5.880, "rwy": 180, "fleet": "Cityflyer", "spec": True},
-    "ZRH": {"icao": "LSZH", "lat": 47.458, "lon": 8.548, "rwy": 160, "fleet": "Cityflyer", "spec": False},
-    "GVA": {"icao": "LSGG", "lat": 46.237, "lon": 6.109, "rwy": 220, "fleet": "Both", "spec": False},
-    "BER": {"icao": "EDDB", "lat": 52.362, "lon": 13.501, "rwy": 250, "fleet": "Cityflyer", "spec": False},
-    "FRA": {"icao": "EDDF", "lat": 50.033, "lon": 8.571, "rwy": 250, "fleet": "Cityflyer", "spec": False},
-    "LIN": {"icao": "LIML", "lat": 45.445, "lon": 9.277, "rwy": 360, "fleet": "Cityflyer", "spec": False},
-    "MAD": {"icao": "LEMD", "lat": 40.494, "lon": -3.567, "rwy": 140, "fleet": "Cityflyer", "spec": False},
-    "IBZ": {"icao": "LEIB", "lat": 38.873, "lon": 1.373, "rwy": 60, "fleet": "Both", "spec": False},
-    "PMI": {"icao": "LEPA", "lat": 39.551, "lon": 2.738, "rwy": 240, "fleet": "Both", "spec": False},
-    "AGP": {"icao": "LEMG", "lat": 36.675, "lon": -4.499, "rwy": 130, "fleet": "Both", "spec": False},
-    "FAO": {"icao": "LPFR", "lat": 37.017, "lon": -7.965, "rwy": 280, "fleet": "Cityflyer", "spec": False},
-    "SEN": {"icao": "EGMC", "lat": 51.571, "lon": 0.701, "rwy": 230, "fleet": "Cityflyer", "spec": False},
-    "LGW": {"icao": "EGKK", "lat": 51.148, "lon": -0.190, "rwy": 260, "fleet": "Both", "spec": False},
-    "JER": {"icao": "EGJJ", "lat": 49.208, "lon": -2.195, "rwy": 260, "fleet": "Euroflyer", "spec": False},
-    "INN": {"icao": "LOWI", "lat": 47.260, "lon": 11.344, "rwy": 260, "fleet": "Both", "spec": True},
-    "FNC": {"icao": "LPMA", "lat": 32.694, "lon": -16.774, "rwy": 50, "fleet": "Euroflyer", "spec": True},
-    "NCE": {"icao": "LFMN", "lat": 43.665, "lon": 7.215, "rwy": 40, "fleet": "Both", "spec": False},
-    "VRN": {"icao": "LIPX", "lat": 45.396, "lon": 10.888, "rwy": 40, "fleet": "Euroflyer", "spec": False},
-    "OPO": {"icao": "LPPR", "lat": 41.242, "lon": -8.678, "rwy": 350, "fleet": "Euroflyer", "spec": False},
-    "LYS": {"icao": "LFLL", "lat": 45.726, "lon": 5.090, "rwy": 350, "fleet": "Euroflyer", "spec": False},
-    "SZG": {"icao": "LOWS", "lat": 47.794, "lon": 13.004, "rwy": 330, "fleet": "Euroflyer", "spec": False},
-    "BOD": {"icao": "LFBD", "lat": 44.828, "lon": -0.716, "rwy": 230, "fleet": "Euroflyer", "spec": False},
-    "GNB": {"icao": "LFLS", "lat": 45.363, "lon": 5.330, "rwy": 90, "fleet": "Euroflyer", "spec": False},
-    "TRN": {"icao": "LIMF", "lat": 45.202, "lon": 7.649, "rwy": 360, "fleet": "Euroflyer", "spec": False},
-    "ALC": {"icao": "LEAL", "lat": 38.282, "lon": -0.558, "rwy": 100, "fleet": "Euroflyer", "spec": False},
-    "SVQ": {"icao": "LEZL", "lat": 37.418, "lon": -5.893, "rwy": 270, "fleet": "Euroflyer", "spec": False},
-    "RAK": {"icao": "GMMX", "lat": 31.606, "lon": -8.036, "rwy": 100, "fleet": "Euroflyer", "spec": False},
-    "AGA": {"icao": "GMAD", "lat": 30.325, "lon": -9.413, "rwy": 90, "fleet": "Euroflyer", "spec": False},
-    "SSH": {"icao": "HESH", "lat": 27.977, "lon": 34.394, "rwy": 40, "fleet": "Euroflyer", "spec": False},
-    "PFO": {"icao": "LCPH", "lat": 34.718, "lon": 32.486, "rwy": 290, "fleet": "Euroflyer", "spec": False},
-    "LCA": {"icao": "LCLK", "lat": 34.875, "lon": 33.625, "rwy": 220, "fleet": "Euroflyer", "spec": False},
-    "FUE": {"icao": "GCLP", "lat": 28.452, "lon": -13.864, "rwy": 10, "fleet": "Euroflyer", "spec": False},
-    "TFS": {"icao": "GCTS", "lat": 28.044, "lon": -16.572, "rwy": 70, "fleet": "Euroflyer", "spec": False},
-    "ACE": {"icao": "GCRR", "lat": 28.945, "lon": -13.605, "rwy": 30, "fleet": "Euroflyer", "spec": False},
-    "LPA": {"icao": "GCLP", "lat": 27.931, "lon": -15.386, "rwy": 30, "fleet": "Euroflyer", "spec": False},
-    "IVL": {"icao": "EFIV", "lat": 68.607, "lon": 27.405, "rwy": 40, "fleet": "Euroflyer", "spec": False},
-    "MLA": {"icao": "LMML", "lat": 35.857, "lon": 14.477, "rwy": 310, "fleet": "Euroflyer", "spec": False},
-    "ALG": {"icao": "DAAG", "lat": 36.691, "lon": 3.215, "rwy": 230, "fleet": "Euroflyer", "spec": False},
-    "PSA": {"icao": "LIRP", "lat": 43.683, "lon": 10.392, "rwy": 40, "fleet": "Both", "spec": False},
-    "BLQ": {"icao": "LIPE", "lat": 44.535, "lon": 11.288, "rwy": 120, "fleet": "Both", "spec": False},
-    "PXO": {"icao": "LPPS", "lat": 33.073, "lon": -16.349, "rwy": 180, "fleet": "Both", "spec": False},
-    "MUC": {"icao": "EDDM", "lat": 48.353, "lon": 11.786, "rwy": 80, "fleet": "Both", "spec": False},
-}
+@st.cache_resource
+def get_airport_db():
+    return AirportDB.load()
+
+@st.cache_resource
+def get_network():
+    return load_network(get_airport_db())
+
+base_airports, missing_airports = get_network()
+
+@st.cache_resource
+def get_alternates_index():
+    return AlternatesIndex(base_airports)
 
 if 'investigate_iata' not in st.session_state: st.session_state.investigate_iata = "None"
 if "map_center" not in st.session_state: st.session_state.map_center = [50.0, 10.0]
 if "map_zoom" not in st.session_state: st.session_state.map_zoom = 5
-SCHEDULE_FILE = "active_schedule.csv"
+if "detail_iata" not in st.session_state: st.session_state.detail_iata = None
+if "map_click_seen" not in st.session_state: st.session_state.map_click_seen = None
+
 
 # 5. WEATHER ENGINE 
-@st.cache_data(ttl=900)
-def get_raw_weather_master(airport_dict):
-    raw_res = {}
-    for iata, info in airport_dict.items():
-        try:
-            m = Metar(info['icao']); m.update(); t = Taf(info['icao']); t.update()
-            raw_res[iata] = {"m_obj": m, "t_obj": t, "status": "online"}
-        except: raw_res[iata] = {"status": "offline"}
-    return raw_res
-
-raw_weather_bundle = get_raw_weather_master(base_airports)
-
-def process_weather_for_horizon(bundle, airport_dict, horizon_limit, xw_threshold):
-    processed = {}
-    cutoff_time = datetime.now(timezone.utc) + timedelta(hours=horizon_limit)
-    for iata, data in bundle.items():
-        if data['status'] == "offline" or "m_obj" not in data:
-            processed[iata] = {"status": "offline", "raw_m": "N/A", "raw_t": "N/A", "f_issues": [], "f_wind_spd":0, "f_wind_dir":0, "w_spd":0, "w_dir":0, "f_time": ""}
-            continue
-        
-        m, t, info = data['m_obj'], data.get('t_obj'), airport_dict[iata]
-        v_lim, c_lim = (1500, 500) if info['spec'] else (800, 200)
-        
-        m_vis = m.data.visibility.value if (m.data and hasattr(m.data, 'visibility') and m.data.visibility) else 9999
-        m_cig = 9999
-        if m.data and hasattr(m.data, 'clouds') and m.data.clouds:
-            for lyr in m.data.clouds:
-                if lyr.type in ['BKN', 'OVC'] and lyr.base: m_cig = min(m_cig, lyr.base * 100)
-        
-        w_issues = []
-        f_time = ""
-        
-        if t and hasattr(t, 'data') and t.data and hasattr(t.data, 'forecast') and t.data.forecast:
-            for line in t.data.forecast:
-                if not hasattr(line, 'start_time') or not line.start_time or line.start_time.dt > cutoff_time: continue
-                l_raw = line.raw.upper()
-                if re.search(r'(-SN|\+SN|\bSN\b|\bFZ|\bFG\b)', l_raw): w_issues.append("WINTER/FOG")
-                if (hasattr(line, 'visibility') and line.visibility and line.visibility.value is not None and line.visibility.value < v_lim): w_issues.append("VIS")
-                
-                l_dir = get_safe_num(line.wind_direction.value, info['rwy']) if (hasattr(line, 'wind_direction') and line.wind_direction) else info['rwy']
-                l_spd = max(get_safe_num(line.wind_speed.value) if (hasattr(line, 'wind_speed') and line.wind_speed) else 0, get_safe_num(line.wind_gust.value) if (hasattr(line, 'wind_gust') and line.wind_gust) else 0)
-                
-                if calculate_xwind(l_dir, l_spd, info['rwy']) >= xw_threshold: w_issues.append("XWIND")
-                elif l_spd > 25: w_issues.append("WINDY")
-                
-                if iata == "FLR" and abs(l_spd * math.cos(math.radians(l_dir - 50))) >= 10: w_issues.append("TAILWIND(>10kt)")
-                if w_issues and not f_time: f_time = f"{line.start_time.dt.strftime('%H')}Z"; break
-        
-        w_dir = get_safe_num(m.data.wind_direction.value) if (m.data and hasattr(m.data, 'wind_direction') and m.data.wind_direction) else 0
-        w_spd = get_safe_num(m.data.wind_speed.value) if (m.data and hasattr(m.data, 'wind_speed') and m.data.wind_speed) else 0
-        w_gst = get_safe_num(m.data.wind_gust.value) if (m.data and hasattr(m.data, 'wind_gust') and m.data.wind_gust) else 0
-        
-        processed[iata] = {"vis": m_vis, "cig": m_cig, "status": "online", "w_dir": w_dir, "w_spd": w_spd, "w_gst": w_gst, "raw_m": m.raw or "N/A", "raw_t": t.raw if t else "N/A", "f_issues": list(set(w_issues)), "f_time": f_time}
-    return processed
+AUTO_REFRESH_CHECK = 60 # Seconds between the HUD's checks for a newer snapshot (replaces the full-page meta refresh)
+
+@st.cache_resource
+def get_weather_refresher():
+    return WeatherRefresher(base_airports)
+
+wx_refresher = get_weather_refresher()
+wx_snapshot = wx_refresher.snapshot()
+live_wx_version = wx_snapshot.version   # The live cycle this run draws, kept apart from any replayed snapshot below
+raw_weather_bundle = wx_snapshot.stations
+
+def get_hazard_table(snapshot):
+    return memory.get_or_build("hazard_table", snapshot.version, lambda: HazardTable(snapshot.stations, base_airports))
+
+@st.cache_resource
+def get_flight_poller():
+    return FlightStatusPoller() if FLIGHT_STATUS_ENABLED else None
+
+flight_poller = get_flight_poller()
 
 
 # 6. SIDEBAR MASTER PANEL (Using Placeholders for Perfect Data Sync)
@@ -273,12 +170,23 @@ with st.sidebar:
     # TUCKED AWAY SETTINGS & SCHEDULE (We get inputs here first!)
     with st.expander("⚙️ SCHEDULE & SETTINGS", expanded=False):
         uploaded_file = st.file_uploader("Upload CSV Schedule", type=["csv"])
-        if uploaded_file is not None:
-            with open(SCHEDULE_FILE, "wb") as f: f.write(uploaded_file.getvalue())
-            st.success("✅ Global Schedule Updated!")
+        # The uploader keeps its file across reruns; each upload is offered to the store once, which ignores unchanged content
+        if uploaded_file is not None and st.session_state.get("published_upload") != uploaded_file.file_id:
+            st.session_state.published_upload = uploaded_file.file_id
+            try:
+                published = schedule_store.publish(uploaded_file.getvalue())
+                if published: st.success(f"✅ Global Schedule Updated! (v{published['version']})")
+                else: st.info("Schedule unchanged - already live")
+            except ValueError as e: st.error(f"⚠️ {e}")
+        if missing_airports: st.warning(f"⚠️ No airport/runway data for: {', '.join(missing_airports)}")
         
         selected_date = st.date_input("📅 Operations Date:", value=datetime.now().date())
-        if st.button("🔄 MANUAL DATA REFRESH"): st.cache_data.clear(); st.rerun()
+        replay_day = st.selectbox("⏪ WEATHER REPLAY", ["LIVE"] + wx_refresher.history.days(), format_func=lambda d: d if d == "LIVE" else d.strftime("%d/%m/%y"))
+        replay_at = None
+        if replay_day != "LIVE":
+            replay_cycles = wx_refresher.history.cycles(replay_day)
+            if replay_cycles: replay_at = st.select_slider("CYCLE (UTC)", options=replay_cycles, value=replay_cycles[-1], format_func=lambda t: t.strftime("%H:%MZ"))
+        if st.button("🔄 MANUAL DATA REFRESH"): st.cache_data.clear(); wx_refresher.refresh_now(); st.rerun()
 
     with st.expander("🎯 TACTICAL FILTERS", expanded=False):
         time_horizon = st.radio("SCAN WINDOW", ["Next 6 Hours", "Next 12 Hours", "Next 24 Hours"], index=0)
@@ -291,6 +199,13 @@ with st.sidebar:
         show_cf = st.checkbox("Cityflyer (CFE)", value=True)
         show_ef = st.checkbox("Euroflyer (EFW)", value=True)
         map_theme = st.radio("MAP THEME", ["Dark Mode", "Light Mode"])
+        lazy_popups = st.checkbox("LIGHT MAP (Details on click)", value=True)
+
+    schedule_changes = schedule_store.changes()
+    if not schedule_changes.empty:
+        with st.expander(f"🗂 SCHEDULE CHANGES v{schedule_store.head['version']} ({len(schedule_changes)})", expanded=False):
+            day_first = schedule_changes['DATE'] == selected_date
+            st.dataframe(pd.concat([schedule_changes[day_first], schedule_changes[~day_first]]), hide_index=True, use_container_width=True)
 
     log_placeholder = st.empty()
 
@@ -298,108 +213,133 @@ with st.sidebar:
 # 7. PARSE SCHEDULE & PROCESS WEATHER WITH NEW VARIABLES
 flight_schedule = pd.DataFrame()
 active_stations = set()
-if os.path.exists(SCHEDULE_FILE):
-    with open(SCHEDULE_FILE, "rb") as f: saved_bytes = f.read()
-    flight_schedule = load_schedule_robust(saved_bytes)
+schedule_index, schedule_hash = None, None
+stage_started = metrics.start()
+if schedule_store.head:
+    schedule_hash = schedule_store.head['hash']
+    metrics.size("schedule_csv", schedule_store.head['bytes'])
+    flight_schedule = load_schedule_robust(schedule_store, schedule_hash)
     if not flight_schedule.empty and 'DATE_OBJ' in flight_schedule.columns:
         flight_schedule = flight_schedule[flight_schedule['DATE_OBJ'] == selected_date]
-        if not flight_schedule.empty: active_stations = set(flight_schedule['DEP'].dropna()) | set(flight_schedule['ARR'].dropna())
-
-display_airports = {k: v for k, v in base_airports.items() if k in active_stations} if (not flight_schedule.empty and active_stations) else {k: v for k, v in base_airports.items() if k not in ["PSA", "BLQ", "PXO", "MUC"]}
-
-weather_data = process_weather_for_horizon(raw_weather_bundle, base_airports, temp_horizon_hours, temp_xw_limit)
-
-current_utc_date = datetime.now(timezone.utc).date()
-current_utc_time_str = datetime.now(timezone.utc).strftime('%H%M')
-display_time = datetime.now(timezone.utc).strftime("%H:%M")
+        # Keyed on the last version that changed this day, so an upload touching other days leaves its index and views alone
+        schedule_hash = schedule_store.date_key(schedule_hash, selected_date)
+        if not flight_schedule.empty:
+            schedule_index = get_schedule_index(flight_schedule, schedule_hash, selected_date)
+            active_stations = schedule_index.stations
+metrics.stop("schedule", stage_started)
+
+inbound_legs = schedule_index.inbound if schedule_index else {}
+status_version = None
+if schedule_index and flight_poller:
+    flight_poller.track(schedule_index.flights_by_arrival())
+    status_version, status_frame = flight_poller.frame()
+    inbound_legs = schedule_index.with_status(status_frame, status_version)
+
+display_airports = {k: v for k, v in base_airports.items() if k in active_stations} if (not flight_schedule.empty and active_stations) else {k: v for k, v in base_airports.items() if not v['alt_only']}
+
+# A replayed cycle stands in for the live snapshot everywhere below, with the clock set to its fetch time; nothing is fetched
+replay_snapshot = wx_refresher.history.snapshot_at(replay_at) if replay_at is not None else None
+if replay_snapshot: wx_snapshot = replay_snapshot
+now_utc = wx_snapshot.fetched_at if replay_snapshot else datetime.now(timezone.utc)
+
+stage_started = metrics.start()
+hazard_table = get_hazard_table(wx_snapshot)
+# Per-flight forecast bits at each leg's own STA (arrivals) / STD (departures), indexed by LEG
+arr_hazard = hazard_table.leg_flags(schedule_index.arrivals, 'ARR', 'STA_TS', temp_xw_limit, schedule_index.owner) if schedule_index and schedule_index.arrivals is not None else None
+dep_hazard = hazard_table.leg_flags(schedule_index.departures, 'DEP', 'STD_TS', temp_xw_limit, schedule_index.owner) if schedule_index and schedule_index.departures is not None else None
+wx_history = wx_refresher.history.window(now_utc if replay_snapshot else None)
+metrics.stop("process", stage_started)
+
+current_utc_date = now_utc.date()
+current_utc_ts = now_utc.timestamp()
+display_time = now_utc.strftime("%H:%M")
 
 
 # 8. MAP MARKERS & ALERTS (WITH AIRCRAFT/FLEET AWARENESS)
-metar_alerts, taf_alerts, map_markers = {}, {}, []
-for iata, info in display_airports.items():
-    data = weather_data.get(iata)
-    if not data: continue
-    
-    is_cf_station, is_ef_station = False, False
-    if not flight_schedule.empty:
-        sf = flight_schedule[(flight_schedule['DEP'] == iata) | (flight_schedule['ARR'] == iata)]
-        if not sf.empty:
-            ac_types = sf['AC'].dropna().astype(str).str.upper().unique()
-            if any('E90' in ac for ac in ac_types): is_cf_station = True
-            if any(ac in ['31E', '32E', '320', '319'] for ac in ac_types): is_ef_station = True
-            if not is_cf_station and not is_ef_station: 
-                is_cf_station = (info.get('fleet') in ['Cityflyer', 'Both'])
-                is_ef_station = (info.get('fleet') in ['Euroflyer', 'Both'])
-        else:
-            is_cf_station = (info.get('fleet') in ['Cityflyer', 'Both'])
-            is_ef_station = (info.get('fleet') in ['Euroflyer', 'Both'])
-    else:
-        is_cf_station = (info.get('fleet') in ['Cityflyer', 'Both'])
-        is_ef_station = (info.get('fleet') in ['Euroflyer', 'Both'])
-        
-    if not ((is_cf_station and show_cf) or (is_ef_station and show_ef)): continue
-
-    v_lim, c_lim = (1500, 500) if info['spec'] else (800, 200)
-    m_issues = []
-    
-    cur_w_dir = get_safe_num(data.get('w_dir', 0))
-    cur_w_spd = get_safe_num(data.get('w_spd', 0))
-    cur_w_gst = get_safe_num(data.get('w_gst', 0))
-    cur_xw = calculate_xwind(cur_w_dir, max(cur_w_spd, cur_w_gst), info['rwy'])
-    raw_m = data['raw_m'].upper()
-    
-    if re.search(r'\bFG\b', raw_m): m_issues.append("FOG")
-    if re.search(r'(-SN|\+SN|\bSN\b|\bFZ)', raw_m): m_issues.append("WINTER")
-    if data.get('vis', 9999) < v_lim: m_issues.append("VIS")
-    if data.get("cig", 9999) < c_lim: m_issues.append("CLOUD")
-    if re.search(r'\bTS|VCTS', raw_m): m_issues.append("TSRA")
-    if cur_xw >= temp_xw_limit: m_issues.append("XWIND")
-    if cur_w_gst > 25 and "XWIND" not in m_issues: m_issues.append("WINDY")
-    
-    if iata == "FLR":
-        tw_comp = abs(max(cur_w_spd, cur_w_gst) * math.cos(math.radians(cur_w_dir - 50)))
-        if tw_comp >= 10: m_issues.append("TAILWIND(>10kt)")
-    
-    trend_icon = "➡️"
-    if not m_issues and data['f_issues']: trend_icon = "📈"
-    elif m_issues and not data['f_issues']: trend_icon = "📉"
-    
-    color = "#008000"
-    if m_issues: color = "#d6001a" if any(x in m_issues for x in ["FOG","WINTER","VIS","TSRA","XWIND","TAILWIND(>10kt)"]) else "#eb8f34"
-    elif data['f_issues']: color = "#eb8f34"
-    
-    rwy_text = f"RWY {int(info['rwy']/10):02d}/{int(((info['rwy']+180)%360)/10):02d}"
-    if m_issues: metar_alerts[iata] = {"type": "/".join(m_issues), "hex": "primary" if color == "#d6001a" else "secondary"}
-    if data['f_issues']: taf_alerts[iata] = {"type": "+".join(data['f_issues']), "time": data['f_time'], "hex": "secondary"}
-    
-    if hazard_filter == "Any Amber/Red Alert" and color == "#008000": continue
-    elif hazard_filter not in ["Show All Network", "Any Amber/Red Alert"] and filter_map.get(hazard_filter) not in m_issues and filter_map.get(hazard_filter) not in data['f_issues']: continue
-    
+def flight_status(cancelled, bits, due_ts, mkr):
+    # Each leg is judged on the TAF valid at its own STA/STD; legs due within the hour also take the station's live METAR
+    due_soon = mkr['m_issues'] and due_ts - current_utc_ts <= 3600
+    if cancelled: return "CANC", RED
+    if bits & HZ_AT_RISK or (due_soon and mkr['color'] == RED): return "AT RISK", RED
+    if bits or due_soon: return "CAUTION", AMBER
+    return "SCHED", GREEN
+
+def legs_table_html(title, time_cols, rows):
+    return f"""<div style='margin-top:15px; border-top: 2px solid #002366; padding-top:10px;'><b style='color:#002366; font-size:14px;'>{title} ({selected_date.strftime('%d/%m/%Y')})</b><div style='max-height: 200px; overflow-y: auto; margin-top:5px; border: 1px solid #ccc; background: #fff;'><table style='width:100%; text-align:left; font-size:12px; border-collapse: collapse; color: #000;'><tr style='background:#002366; color:#fff;'><th style='padding:5px;'>Status</th><th style='padding:5px;'>FLT</th><th style='padding:5px;'>DEP</th><th style='padding:5px;'>ARR</th>{"".join(f"<th style='padding:5px;'>{col}</th>" for col in time_cols)}</tr>{"".join(rows)}</table></div></div>"""
+
+def station_detail_html(mkr):
+    iata, color, data = mkr['iata'], mkr['color'], mkr['data']
     m_bold, t_bold = bold_hazard(data.get('raw_m', 'N/A')), bold_hazard(data.get('raw_t', 'N/A'))
     
     inbound_html = ""
-    if not flight_schedule.empty:
-        arr_flights = flight_schedule[flight_schedule['ARR'] == iata].sort_values(by='STA')
-        if not arr_flights.empty:
-            rows = ""
-            for _, row in arr_flights.iterrows():
-                sta_raw = str(row['STA']).strip()
-                sta_clean = sta_raw.replace(':', '') 
-                flight_date = row['DATE_OBJ']
-                if flight_date < current_utc_date: continue
-                if flight_date == current_utc_date and sta_clean < current_utc_time_str: continue
-                
-                flt, dep, arr, canc = str(row['FLT']).strip(), str(row['DEP']).strip(), str(row['ARR']).strip(), row.get('Cancellation Reason', None)
-                f_status, f_color = "SCHED", "#008000"
-                if pd.notna(canc) and str(canc).strip() != "": f_status, f_color = "CANC", "#d6001a"
-                elif color == "#d6001a": f_status, f_color = "AT RISK", "#d6001a"
-                elif color == "#eb8f34": f_status, f_color = "CAUTION", "#eb8f34"
-                    
-                rows += f"<tr style='border-bottom: 1px solid #ddd;'><td style='color:{f_color}; font-weight:bold; padding:4px;'>{f_status}</td><td style='padding:4px;'>{flt}</td><td style='padding:4px;'>{dep}</td><td style='padding:4px;'>{arr}</td><td style='padding:4px;'>{sta_raw}</td></tr>"
-            if rows: inbound_html = f"""<div style='margin-top:15px; border-top: 2px solid #002366; padding-top:10px;'><b style='color:#002366; font-size:14px;'>🛬 YET TO ARRIVE ({selected_date.strftime('%d/%m/%Y')})</b><div style='max-height: 200px; overflow-y: auto; margin-top:5px; border: 1px solid #ccc; background: #fff;'><table style='width:100%; text-align:left; font-size:12px; border-collapse: collapse; color: #000;'><tr style='background:#002366; color:#fff;'><th style='padding:5px;'>Status</th><th style='padding:5px;'>FLT</th><th style='padding:5px;'>DEP</th><th style='padding:5px;'>ARR</th><th style='padding:5px;'>STA</th></tr>{rows}</table></div></div>"""
+    if iata in inbound_legs:
+        rows = []
+        for flt, dep, arr, sta_raw, due_ts, flight_date, cancelled, eta, atd, leg in inbound_legs[iata]:
+            # Legs drop out once due (an overnight arrival on the day after its DATE); untimed ones with their date
+            if due_ts < current_utc_ts or (flight_date < current_utc_date and not due_ts >= current_utc_ts): continue
+            f_status, f_color = flight_status(cancelled, arr_hazard[leg], due_ts, mkr)
+            rows.append(f"<tr style='border-bottom: 1px solid #ddd;'><td style='color:{f_color}; font-weight:bold; padding:4px;'>{f_status}</td><td style='padding:4px;'>{flt}</td><td style='padding:4px;'>{dep}</td><td style='padding:4px;'>{arr}</td><td style='padding:4px;'>{sta_raw}</td><td style='padding:4px;'>{eta or '--'}</td><td style='padding:4px;'>{atd or '--'}</td></tr>")
+        if rows: inbound_html = legs_table_html("🛬 YET TO ARRIVE", ("STA", "ETA", "ATD"), rows)
+    if schedule_index and iata in schedule_index.outbound:
+        rows = []
+        for flt, dep, arr, std_raw, std_ts, flight_date, cancelled, leg in schedule_index.outbound[iata]:
+            if std_ts < current_utc_ts or (flight_date < current_utc_date and not std_ts >= current_utc_ts): continue
+            f_status, f_color = flight_status(cancelled, dep_hazard[leg], std_ts, mkr)
+            rows.append(f"<tr style='border-bottom: 1px solid #ddd;'><td style='color:{f_color}; font-weight:bold; padding:4px;'>{f_status}</td><td style='padding:4px;'>{flt}</td><td style='padding:4px;'>{dep}</td><td style='padding:4px;'>{arr}</td><td style='padding:4px;'>{std_raw}</td></tr>")
+        if rows: inbound_html += legs_table_html("🛫 YET TO DEPART", ("STD",), rows)
     
-    shared_content = f"""<div style="width:580px; color:black !important; font-family:monospace; font-size:14px; background:white; padding:15px; border-radius:5px;"><b style="color:#002366; font-size:18px;">{iata} STATUS {trend_icon}</b><div style="margin-top:8px; padding:10px; border-left:6px solid {color}; background:#f9f9f9; font-size:16px;"><b style="color:#002366;">{rwy_text} X-Wind:</b> <b>{cur_xw} KT</b><br><b>ACTUAL:</b> {"/".join(m_issues) if m_issues else "STABLE"}<br><b>FORECAST ({temp_horizon_hours}H):</b> {"+".join(data['f_issues']) if data['f_issues'] else "NIL"}</div><hr style="border:1px solid #ddd;"><div style="display:flex; gap:12px;"><div style="flex:1; background:#f0f0f0; padding:10px; border-radius:4px; white-space: pre-wrap; word-wrap: break-word;"><b>METAR</b><br>{m_bold}</div><div style="flex:1; background:#f0f0f0; padding:10px; border-radius:4px; white-space: pre-wrap; word-wrap: break-word;"><b>TAF</b><br>{t_bold}</div></div>{inbound_html}</div>"""
-    map_markers.append({"lat": info['lat'], "lon": info['lon'], "color": color, "content": shared_content, "iata": iata, "trend": trend_icon})
+    m_issues = mkr['m_issues']
+    return f"""<div style="width:580px; color:black !important; font-family:monospace; font-size:14px; background:white; padding:15px; border-radius:5px;"><b style="color:#002366; font-size:18px;">{iata} STATUS {mkr['trend']}</b><div style="margin-top:8px; padding:10px; border-left:6px solid {color}; background:#f9f9f9; font-size:16px;"><b style="color:#002366;">{mkr['rwy_text']} X-Wind:</b> <b>{mkr['xw']} KT</b><br><b>ACTUAL:</b> {"/".join(m_issues) + mkr['since'] if m_issues else "STABLE"}<br><b>FORECAST ({temp_horizon_hours}H):</b> {"+".join(data['f_issues']) if data['f_issues'] else "NIL"}</div><hr style="border:1px solid #ddd;"><div style="display:flex; gap:12px;"><div style="flex:1; background:#f0f0f0; padding:10px; border-radius:4px; white-space: pre-wrap; word-wrap: break-word;"><b>METAR</b><br>{m_bold}</div><div style="flex:1; background:#f0f0f0; padding:10px; border-radius:4px; white-space: pre-wrap; word-wrap: break-word;"><b>TAF</b><br>{t_bold}</div></div>{inbound_html}</div>"""
+
+# Every screen with the same settings draws the same picture, so the view (forecast window, trends, markers, alerts) is
+# built once per process and shared. Popups list the legs still to come, hence the clock minute and flight-status version in
+# the key. Alerts live on a board per alert setting: unchanged stations keep their assessment, the alert dicts are patched
+# in place, and whatever appeared, cleared or escalated between passes lands in the board's change feed.
+ALERT_BOARD_ENTRIES = 32   # Distinct alert settings tracked at once
+
+@st.cache_resource(max_entries=ALERT_BOARD_ENTRIES)
+def get_alert_board(key):
+    return AlertBoard(key)
+
+def get_network_view(*key):
+    return memory.get_or_build("view", key, lambda: build_network_view(*key))
+
+def build_network_view(wx_version, schedule_hash, ops_date, horizon, xw_limit, show_cf, show_ef, hazard_filter, lazy_popups, clock_minute, status_version):
+    weather = process_weather_for_horizon(hazard_table, horizon, xw_limit, now_utc)
+    trends = wx_refresher.history.trends(wx_history, xw_limit, now_utc)
+    # Replayed cycles (negative versions) are judged on a throwaway board: scrubbing history must never write changes into
+    # the feed the live screens share, and a board's first pass reports none, so a replayed view carries an empty feed
+    board = AlertBoard() if wx_version < 0 else get_alert_board((ops_date, horizon, xw_limit, show_cf, show_ef, tuple(display_airports)))
+    markers = []
+    with board.lock:
+        board.begin(wx_version)
+        for iata, info in display_airports.items():
+            data = weather.get(iata)
+            if not data: continue
+            
+            is_cf_station, is_ef_station = schedule_index.station_fleet(iata, info) if schedule_index else airport_fleet(info)
+            if not ((is_cf_station and show_cf) or (is_ef_station and show_ef)): continue
+        
+            a = board.assess(iata, info, data, xw_limit, *trends.get(iata, (None, None)))
+            color, m_issues = a['color'], a['m_issues']
+            
+            if hazard_filter == "Any Amber/Red Alert" and color == GREEN: continue
+            elif hazard_filter not in ["Show All Network", "Any Amber/Red Alert"] and filter_map.get(hazard_filter) not in m_issues and filter_map.get(hazard_filter) not in data['f_issues']: continue
+            
+            # Light map mode ships only position/colour/IATA/trend; the full card is built for the clicked station alone
+            mkr = {"lat": info['lat'], "lon": info['lon'], "color": color, "iata": iata, "trend": a['trend'], "m_issues": m_issues, "since": a['since'], "xw": a['xw'], "rwy_text": a['rwy_text'], "data": data}
+            if not lazy_popups: mkr['content'] = station_detail_html(mkr)
+            markers.append(mkr)
+        changes = board.end(display_time)
+        # Copies, so a pass running for another screen never patches the dicts this one is iterating
+        return {"weather_data": weather, "markers": markers, "metar_alerts": dict(board.metar), "taf_alerts": dict(board.taf), "feed": list(board.feed), "changed": bool(changes)}
+
+stage_started = metrics.start()
+view_key = (wx_snapshot.version, schedule_hash, selected_date, temp_horizon_hours, temp_xw_limit, show_cf, show_ef,
+            hazard_filter, lazy_popups, int(now_utc.timestamp() // 60), status_version)
+view = get_network_view(*view_key)
+weather_data, map_markers, metar_alerts, taf_alerts = view["weather_data"], view["markers"], view["metar_alerts"], view["taf_alerts"]
+metrics.stop("markers", stage_started)
 
 
 # 9. INJECT DYNAMIC STRATEGY BRIEF INTO SIDEBAR PLACEHOLDER (With fixed text colors!)
@@ -409,36 +349,18 @@ with brief_placeholder.container():
         st.markdown(f"<h3 style='color: #eb8f34; text-align: center; margin-top: 0px;'>📋 {iata} STRATEGY BRIEF</h3>", unsafe_allow_html=True)
         
         d = weather_data.get(iata, {})
-        info = base_airports.get(iata, {"rwy": 0, "lat": 0, "lon": 0})
+        info = base_airports.get(iata, {"rwy": 0, "rwys": (), "lat": 0, "lon": 0})
         cur_w_dir = get_safe_num(d.get('w_dir', 0))
         cur_w_spd = get_safe_num(d.get('w_spd', 0))
         cur_w_gst = get_safe_num(d.get('w_gst', 0))
-        cur_xw = calculate_xwind(cur_w_dir, max(cur_w_spd, cur_w_gst), info['rwy'])
-        
-        preferred_alts = []
-        if iata == "FLR": preferred_alts = ["PSA", "BLQ"]
-        elif iata == "FNC": preferred_alts = ["PXO"]
-        elif iata == "INN": preferred_alts = ["MUC"]
-        
-        alt_list = []
-        for g in base_airports.keys():
-            if g != iata:
-                dist = calculate_dist(info['lat'], info['lon'], base_airports[g]['lat'], base_airports[g]['lon'])
-                alt_wx = weather_data.get(g, {})
-                alt_w_dir = get_safe_num(alt_wx.get('w_dir', 0))
-                alt_w_spd = get_safe_num(alt_wx.get('w_spd', 0))
-                alt_w_gst = get_safe_num(alt_wx.get('w_gst', 0))
-                alt_xw = calculate_xwind(alt_w_dir, max(alt_w_spd, alt_w_gst), base_airports[g]['rwy'])
-                score = dist
-                if g in preferred_alts: score -= 1000 
-                alt_list.append({"iata": g, "dist": dist, "xw": alt_xw, "score": score})
+        rwy_name, cur_xw = best_runway(cur_w_dir, max(cur_w_spd, cur_w_gst), info['rwys'])
         
-        alt_list = sorted(alt_list, key=lambda x: x['score'])[:3]
+        alt_list = get_alternates_index().rank(iata, hazard_table, hazard_table.evaluate(temp_horizon_hours, temp_xw_limit, now_utc), temp_xw_limit)
         alt_rows = "".join([f"<tr style='border-bottom: 1px solid #aaa;'><td style='color:#002366 !important;'><b>{a['iata']}</b></td><td style='color:#002366 !important;'>{a['dist']} NM</td><td style='color:#002366 !important;'>{a['xw']} kt</td></tr>" for a in alt_list])
         
         st.markdown(f"""
         <div style="background-color: white; padding: 15px; border-radius: 8px; margin-bottom: 15px; box-shadow: 0 4px 6px rgba(0,0,0,0.3);">
-            <b style="font-size: 15px; color:#002366 !important;">Live {int(info['rwy']/10):02d}/{int(((info['rwy']+180)%360)/10):02d} X-Wind:</b> <b style="color:#d6001a !important;">{cur_xw} kt</b><br>
+            <b style="font-size: 15px; color:#002366 !important;">Live {rwy_name} X-Wind:</b> <b style="color:#d6001a !important;">{cur_xw} kt</b><br>
             <hr style="margin: 10px 0; border: 1px solid #ccc;">
             <b style="color:#d6001a !important;">Tactical Alternates:</b>
             <table style="width:100%; text-align: left; font-size: 13px; margin-top: 5px; border-collapse: collapse;">
@@ -463,26 +385,90 @@ with alerts_placeholder.container():
     if metar_alerts:
         st.markdown("<p style='color:white; margin-bottom: 5px;'>🔴 <b>ACTUAL HAZARDS (NOW)</b></p>", unsafe_allow_html=True)
         for iata, d in metar_alerts.items():
-            if st.button(f"{iata} | {d['type']}", key=f"m_{iata}", type=d['hex']): st.session_state.investigate_iata = iata
+            if st.button(f"{iata} | {d['type']}{d['since']}", key=f"m_{iata}", type=d['hex']): st.session_state.investigate_iata = iata
     if taf_alerts:
         st.markdown(f"<p style='color:white; margin-top: 15px; margin-bottom: 5px;'>🟠 <b>FORECAST HAZARDS ({temp_horizon_hours}H)</b></p>", unsafe_allow_html=True)
         for iata, d in taf_alerts.items():
             if st.button(f"{iata} | {d['time']} {d['type']}", key=f"f_{iata}", type="secondary"): st.session_state.investigate_iata = iata
+    if view["feed"]:
+        with st.expander(f"🔔 CHANGES ({len(view['feed'])})", expanded=view["changed"]):
+            icons = {"NEW": "🆕", "ESCALATED": "⏫", "CLEARED": "✅"}
+            st.markdown("<br>".join(f"<span style='color:white; font-family:monospace;'>{t}Z {icons[change]} {iata} {kind} {change} {what}</span>"
+                                    for t, iata, kind, change, what in view["feed"]), unsafe_allow_html=True)
 
 
 # 11. INJECT HANDOVER LOG INTO BOTTOM EXPANDER
 with log_placeholder.container():
-    h_txt = f"HANDOVER {display_time}Z | SCAN WINDOW: {temp_horizon_hours}H\n" + "="*50 + "\n"
-    for i_ata, d_taf in taf_alerts.items(): h_txt += f"{i_ata}: {d_taf['type']} ({d_taf['time']})\n"
+    shift_events = wx_refresher.history.events(wx_history, temp_xw_limit, now_utc - timedelta(hours=HANDOVER_WINDOW_HOURS))
+    h_txt = handover_text(display_time, temp_horizon_hours, metar_alerts, taf_alerts, shift_events)
     with st.expander("📝 SHIFT HANDOVER LOG", expanded=False):
         st.text_area("Handover Report:", value=h_txt, height=200, label_visibility="collapsed")
 
 
 # 12. RENDER FULL SCREEN MAP
-st.markdown(f'<div class="floating-hud"><div>📡 Command Edition</div><div>|</div><div style="color: #eb8f34;">{display_time} Z</div></div>', unsafe_allow_html=True)
-
+# The clock ticks and the snapshot is polled inside a fragment; only a new snapshot (or a stale page) reruns the app,
+# and even then the base map is untouched - the hazard layer below is swapped in place, keeping the operator's pan/zoom
+st.session_state.rendered_wx_version, st.session_state.rendered_at = live_wx_version, time.time()
+
+@st.fragment(run_every=AUTO_REFRESH_CHECK)
+def live_hud():
+    if wx_refresher.current.version != st.session_state.rendered_wx_version or time.time() - st.session_state.rendered_at > REFRESH_INTERVAL:
+        st.rerun(scope="app")
+    hud_time = f"⏪ REPLAY {now_utc:%d/%m %H:%M}" if replay_snapshot else datetime.now(timezone.utc).strftime("%H:%M")
+    wx_age = wx_refresher.age_minutes()
+    wx_age_color = "#d6001a" if wx_age is None or wx_age * 60 > 2 * REFRESH_INTERVAL else "white"
+    st.markdown(f'<div class="floating-hud"><div>📡 Command Edition</div><div>|</div><div style="color: #eb8f34;">{hud_time} Z</div><div>|</div><div style="color: {wx_age_color};">WX {"--" if wx_age is None else wx_age}m OLD</div></div>', unsafe_allow_html=True)
+
+live_hud()
+
+stage_started = metrics.start()
 m = folium.Map(location=st.session_state.map_center, zoom_start=st.session_state.map_zoom, tiles=("CartoDB dark_matter" if map_theme == "Dark Mode" else "CartoDB positron"), scrollWheelZoom=False)
+hazard_layer = folium.FeatureGroup(name="hazards")
 for mkr in map_markers:
-    folium.CircleMarker(location=[mkr['lat'], mkr['lon']], radius=7, color=mkr['color'], fill=True, popup=folium.Popup(mkr['content'], max_width=650, auto_pan=True, auto_pan_padding=(150, 150)), tooltip=folium.Tooltip(mkr['content'], direction='top', sticky=False)).add_to(m)
-
-st_folium(m, width=None, height=1200, use_container_width=True, key="map_stable_v30")
+    if lazy_popups: folium.CircleMarker(location=[mkr['lat'], mkr['lon']], radius=7, color=mkr['color'], fill=True, tooltip=f"{mkr['iata']} {mkr['trend']}").add_to(hazard_layer)
+    else: folium.CircleMarker(location=[mkr['lat'], mkr['lon']], radius=7, color=mkr['color'], fill=True, popup=folium.Popup(mkr['content'], max_width=650, auto_pan=True, auto_pan_padding=(150, 150)), tooltip=folium.Tooltip(mkr['content'], direction='top', sticky=False)).add_to(hazard_layer)
+
+if metrics.enabled:
+    # What ships: the base map plus the hazard layer's script, measured before st_folium attaches the layer to the map
+    # (rendering it afterwards counts the layer twice); the measuring itself is kept out of the map stage's time
+    measured = time.perf_counter()
+    metrics.size("map_html", len(m.get_root().render()) + len(generate_leaflet_string(hazard_layer)))
+    metrics.size("marker_popup_html", sum(len(mkr.get('content', '')) for mkr in map_markers))
+    stage_started += time.perf_counter() - measured
+
+# Only marker clicks come back to the server; panning/zooming no longer reruns the script
+map_state = st_folium(m, feature_group_to_add=hazard_layer, width=None, height=1200, use_container_width=True, key="map_stable_v30", returned_objects=["last_object_clicked_tooltip", "last_object_clicked_count"]) or {}
+metrics.stop("map", stage_started)
+
+# 13. ON-DEMAND STATION DETAIL
+if lazy_popups:
+    click = (map_state.get("last_object_clicked_count"), map_state.get("last_object_clicked_tooltip"))
+    if click[0] and click != st.session_state.map_click_seen:
+        st.session_state.map_click_seen = click
+        st.session_state.detail_iata = str(click[1] or "").split(" ")[0] or None
+    detail = next((mkr for mkr in map_markers if mkr['iata'] == st.session_state.detail_iata), None)
+    if detail:
+        with st.container(key="station_detail"):
+            # One card per station and view, so reruns and other screens on the same view reuse it
+            st.markdown(memory.get_or_build("station_detail", (detail['iata'],) + view_key, lambda: station_detail_html(detail)), unsafe_allow_html=True)
+            if st.button("✖ CLOSE DETAIL", key="close_detail", type="primary"):
+                st.session_state.detail_iata = None
+                st.rerun()
+
+# 14. DIAGNOSTICS (HUD_METRICS=1 only)
+if metrics.enabled:
+    metrics.lru("scan_hazards", scan_hazards.cache_info()); metrics.lru("bold_hazard", bold_hazard.cache_info())
+    metrics.memory_usage(memory.usage())
+    metrics.flush()
+    diag = metrics.to_dict()
+    with st.sidebar.expander("🛠 DIAGNOSTICS", expanded=False):
+        st.dataframe(pd.DataFrame(diag["stages"]).T, use_container_width=True)
+        st.dataframe(pd.DataFrame(diag["caches"]).T, use_container_width=True)
+        failed = {iata: f["error"] for iata, f in diag["fetch"].items() if f["error"]}
+        slowest = sorted(diag["fetch"].items(), key=lambda kv: kv[1]["latency_s"] or 0, reverse=True)[:5]
+        st.caption(f"FETCH FAILURES: {len(failed)} {failed if failed else ''}")
+        st.caption("SLOWEST: " + ", ".join(f"{iata} {f['latency_s']}s" for iata, f in slowest))
+        st.caption("PAYLOADS: " + ", ".join(f"{k} {v / 1024:.1f} KB" for k, v in diag["payload_bytes"].items()))
+        mem = diag["memory"]
+        st.caption(f"MEMORY: {mem['total'] / 2**20:.1f} / {mem['budget'] / 2**20:.0f} MB")
+        st.dataframe(pd.DataFrame(mem["caches"]).T.assign(MB=lambda d: (d['bytes'] / 2**20).round(2)).drop(columns='bytes'), use_container_width=True)
@@ -0,0 +1,400 @@
+"""Offline benchmark for the HUD pipeline.
+
+Replays recorded METAR/TAF text from a local HTTP stand-in, generates synthetic
+schedules in the export layout, and times each stage of app.py and hud_engine.py:
+
+    fetch      get_raw_weather_master over every network station
+    schedule   cold CSV parse + ScheduleIndex for the ops date
+    process    HazardTable + process_weather_for_horizon
+    markers    section 8 (marker/alert build: forecast window, trends and every station assessed afresh)
+    brief      section 9 (strategy brief + alternates ranking)
+
+markers and brief are timed cold: the memory budget (views, hazard evaluations, leg flags) and the alert boards are
+cleared before every repeat, so they measure the build rather than a cache hit.
+    folium     section 12 (folium map + marker layer HTML)
+
+Before timing, two checks run against local stand-ins:
+
+    fetch      a station slower than FETCH_TIMEOUT and one still in flight at FETCH_DEADLINE both come back offline,
+               and the run ends on the deadline
+    flights    FlightStatusPoller.frame() follows a 200 (with ETag), keeps its statuses on a 304, holds them through a
+               429 until Retry-After has passed, and keeps one flight number's statuses apart by date; requests are
+               filtered by airline and paged past a first page of other flights, and the poll interval follows the quota;
+               a second caller's date is polled alongside the first, and interest nobody renews expires
+    overnight  every synthetic leg is blocked at two hours, so legs departing after 22:00 must parse to arrive the next day,
+               and a live ETA just before midnight on an STA just after it stays ten minutes early rather than a day late
+
+Usage:
+    python bench/benchmark.py                      # compare against bench/baseline.json
+    python bench/benchmark.py --update-baseline    # write a new baseline
+    python bench/benchmark.py --record             # refresh fixtures from the live API
+    python bench/benchmark.py --delay EGLC=3       # add 3 s to every EGLC report (repeatable)
+"""
+import argparse
+import hashlib
+import http.server
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import random
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse, parse_qs
+
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+APP_PATH = os.path.join(REPO_DIR, "app.py")
+FIXTURES = os.path.join(BENCH_DIR, "fixtures", "wx_reports.json")
+BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+SIZES = (1_000, 10_000, 100_000)
+SECTION_RE = re.compile(r'(?m)^(?=# \d+\. )')
+DAY_GROUPS = re.compile(r'\b(?:(FM)(\d{2})(\d{4})|(\d{2})(\d{4}Z)|(\d{2})(\d{2})/(\d{2})(\d{2}))\b')
+
+
+# --- Recorded weather ---------------------------------------------------------
+def record_fixtures(icaos, url="https://aviationweather.gov/api/data/{}"):
+    import requests
+    reports = {}
+    for icao in icaos:
+        reports[icao] = {kind: " ".join(requests.get(url.format(kind), params={"ids": icao}, timeout=10).text.split()) for kind in ("metar", "taf")}
+    with open(FIXTURES, "w") as f:
+        json.dump({"recorded_at": datetime.now(timezone.utc).isoformat(), "source": url.format(""), "reports": reports}, f, indent=1, sort_keys=True)
+    print(f"📼 Recorded {len(reports)} stations to {FIXTURES}")
+
+def redate(text, recorded_at, now):
+    # Shift every day-of-month group by the days since recording, so TAF periods stay ahead of the clock
+    shift = (now.date() - recorded_at.date()).days
+    def day(dd):
+        base = recorded_at.replace(day=1) + timedelta(days=int(dd) - 1)
+        if int(dd) < recorded_at.day - 15: base = (base.replace(day=28) + timedelta(days=4)).replace(day=int(dd))
+        return f"{(base + timedelta(days=shift)).day:02d}"
+    def sub(m):
+        if m.group(1): return f"FM{day(m.group(2))}{m.group(3)}"
+        if m.group(4): return f"{day(m.group(4))}{m.group(5)}"
+        return f"{day(m.group(6))}{m.group(7)}/{day(m.group(8))}{m.group(9)}"
+    return DAY_GROUPS.sub(sub, text)
+
+def serve_fixtures(fixtures, delays=None):
+    # Local stand-in for aviationweather.gov; returns the WX_API_URL template to point the app at.
+    # `delays` maps ICAO -> seconds slept before answering; it is read per request, so callers may change it while serving.
+    delays = {} if delays is None else delays
+    now, recorded_at = datetime.now(timezone.utc), datetime.fromisoformat(fixtures["recorded_at"])
+    reports = {icao: {kind: redate(text, recorded_at, now) for kind, text in rep.items()} for icao, rep in fixtures["reports"].items()}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args): pass
+        def do_GET(self):
+            url = urlparse(self.path)
+            icao = parse_qs(url.query).get("ids", [""])[0]
+            if delays.get(icao): time.sleep(delays[icao])
+            body = reports.get(icao, {}).get(url.path.strip("/"), "").encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/{{}}"
+
+
+def serve_flights(flights, retry_after):
+    # Local stand-in for the Aviationstack flights endpoint; returns (FLIGHT_API_URL, log of (time, arr, date, airline, offset,
+    # status)). `flights` maps (arr_iata, flight_date) -> [(flt, eta, atd), ...]; `retry_after` maps arr_iata -> seconds to
+    # answer 429 with. Both are read per request. airline_iata filters on the flight number's prefix, limit/offset page the
+    # result (100 by default, with pagination.total), and each page carries an ETag so a matching If-None-Match gets a 304.
+    served = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args): pass
+        def answer(self, code, body=b"", **headers):
+            served.append((time.time(), self.arr, self.day, self.airline, self.offset, code))
+            self.send_response(code)
+            for name, value in headers.items(): self.send_header(name.replace("_", "-"), value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            self.arr, self.day, self.airline = (query.get(name, [""])[0] for name in ("arr_iata", "flight_date", "airline_iata"))
+            self.offset, limit = int(query.get("offset", ["0"])[0]), int(query.get("limit", ["100"])[0])
+            if retry_after.get(self.arr): return self.answer(429, Retry_After=str(retry_after[self.arr]))
+            data = [{"flight": {"iata": flt}, "flight_date": self.day, "flight_status": "active",
+                     "arrival": {"estimated": f"{self.day}T{eta}:00+00:00" if eta else None}, "departure": {"actual": f"{self.day}T{atd}:00+00:00" if atd else None}}
+                    for (arr, day), legs in list(flights.items()) if (arr, day.isoformat()) == (self.arr, self.day)
+                    for flt, eta, atd in legs if flt.startswith(self.airline)]
+            page = data[self.offset:self.offset + limit]
+            body = json.dumps({"pagination": {"limit": limit, "offset": self.offset, "count": len(page), "total": len(data)}, "data": page}).encode()
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            if self.headers.get("If-None-Match") == etag: return self.answer(304)
+            self.answer(200, body, ETag=etag, Content_Type="application/json")
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/v1/flights", served
+
+
+# --- Synthetic schedules ------------------------------------------------------
+def synthetic_schedule(rows, stations, ops_date, seed=7):
+    # Export layout as load_schedule_robust expects it: a preamble, then DATE/FLT/DEP/ARR/STD/STA/AC/REG/Cancellation
+    rng = random.Random(seed)
+    out = ["BA CITYFLYER EXPORT", "Generated,benchmark", "DATE,FLT,DEP,ARR,STD,STA,AC,REG,Cancellation Reason"]
+    for i in range(rows):
+        dep, arr = rng.sample(stations, 2)
+        date = ops_date + timedelta(days=rng.randint(-1, 2))
+        hh, mm = rng.randint(0, 23), rng.choice((0, 5, 15, 30, 45, 55))
+        sta = f"{(hh + 2) % 24:02d}:{mm:02d}" if rng.random() < .7 else f"{(hh + 2) % 24:02d}{mm:02d}"
+        out.append(f"{date:%d/%m/%y},BA{rng.randint(1000, 9999)},{dep},{arr},{hh:02d}:{mm:02d},{sta},"
+                   f"{rng.choice(('E90', 'E90', '320', '32E', '319', ''))},G-X{i % 99:02d},{'WX' if rng.random() < .05 else ''}")
+    return ("\n".join(out) + "\n").encode()
+
+
+CHECK_LEGS, CHECK_BLOCK, CHECK_EARLY = 2_000, timedelta(hours=2), 600
+
+def check_overnight_legs(engine, stations, ops_date):
+    # Parsed from the same export layout as the timed schedules; an arrival left on its departure date lands 22 h early,
+    # scores no hazard and drops out of the popups as already landed
+    df = engine.parse_schedule_bytes(synthetic_schedule(CHECK_LEGS, stations, ops_date)).dropna(subset=['STD_DT', 'STA_DT'])
+    failures, overnight = [], df['STA'].str.replace(":", "") < df['STD'].str.replace(":", "")
+    block = df['STA_DT'] - df['STD_DT']
+    if (block != CHECK_BLOCK).any(): failures.append(f"{(block != CHECK_BLOCK).sum()} of {len(df)} legs ({(overnight & (block != CHECK_BLOCK)).sum()} overnight) not blocked at {CHECK_BLOCK}")
+    if not overnight.any(): failures.append("no overnight legs in the synthetic schedule")
+
+    # Every leg of the day reported CHECK_EARLY seconds early (one leg per flight, as statuses are): due times must follow,
+    # across midnight too
+    index = engine.ScheduleIndex(df[df['DATE_OBJ'] == ops_date].drop_duplicates(['FLT', 'DATE_OBJ']))
+    sta = index.arrivals['STA_TS']
+    eta = pd.to_datetime(sta - CHECK_EARLY, unit='s')
+    status = index.arrivals[['FLT', 'DATE_OBJ']].assign(ETA=eta.dt.strftime("%H:%M"), ATD="", ETA_MIN=eta.dt.hour * 60 + eta.dt.minute)
+    wrong = [leg for legs in index.with_status(status, -1).values() for leg in legs if leg[4] != sta[leg[9]] - CHECK_EARLY]
+    if wrong: failures.append(f"{len(wrong)} legs due a day off their ETA, e.g. {wrong[0][:5]}")
+    return [f"overnight: {failure}" for failure in failures]
+
+
+# --- App harness --------------------------------------------------------------
+class App:
+    # app.py executed section by section in one namespace, outside `streamlit run` (widgets return their defaults)
+    def __init__(self):
+        with open(APP_PATH) as f: src = f.read()
+        self.sections = {}
+        for part in SECTION_RE.split(src):
+            num = part.split(".", 1)[0].lstrip("# ")
+            self.sections[int(num) if num.isdigit() else 0] = compile(part, APP_PATH, "exec")
+        self.ns = {"__file__": APP_PATH, "__name__": "__bench__"}
+
+    def run(self, *nums):
+        for n in nums: exec(self.sections[n], self.ns)
+
+    def __getitem__(self, name): return self.ns[name]
+
+
+def timed(fn, repeat, setup=None):
+    # Median of `repeat` runs of fn; setup runs untimed before each one
+    samples = []
+    for _ in range(repeat):
+        if setup: setup()
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return round(statistics.median(samples), 4)
+
+# --- Checks -------------------------------------------------------------------
+# Short timeouts stand in for FETCH_TIMEOUT/FETCH_DEADLINE so the check runs in seconds: STALLED answers long after the
+# per-request timeout, SLOW answers each request inside it but needs longer than the deadline for its METAR and TAF together
+CHECK_TIMEOUT, CHECK_DEADLINE, CHECK_SLOW, CHECK_STALLED = 2.0, 2.6, 1.5, 30
+
+def check_fetch_deadline(engine, airports, delays, online):
+    # `online`: stations the unstalled fetch brought back, the only ones expected online again
+    stalled, slow = sorted(online)[:2]
+    delays.update({airports[stalled]['icao']: CHECK_STALLED, airports[slow]['icao']: CHECK_SLOW})
+    timeout, deadline = engine.FETCH_TIMEOUT, engine.FETCH_DEADLINE
+    engine.FETCH_TIMEOUT, engine.FETCH_DEADLINE = CHECK_TIMEOUT, CHECK_DEADLINE
+    try:
+        t0 = time.perf_counter()
+        bundle = engine.get_raw_weather_master(airports)
+        elapsed = time.perf_counter() - t0
+    finally:
+        engine.FETCH_TIMEOUT, engine.FETCH_DEADLINE = timeout, deadline
+        for iata in (stalled, slow): delays.pop(airports[iata]['icao'], None)
+    failures = []
+    if bundle[stalled].status != "offline" or bundle[stalled].error == "deadline": failures.append(f"{stalled} (stalled) {bundle[stalled].status}/{bundle[stalled].error}, expected a timeout")
+    if bundle[slow].status != "offline" or bundle[slow].error != "deadline": failures.append(f"{slow} (slow) {bundle[slow].status}/{bundle[slow].error}, expected deadline")
+    offline = [iata for iata, wx in bundle.items() if iata in online and iata not in (stalled, slow) and wx.status != "online"]
+    if offline: failures.append(f"healthy stations offline: {', '.join(offline)}")
+    if elapsed > CHECK_DEADLINE + 1: failures.append(f"fetch took {elapsed:.1f}s against a {CHECK_DEADLINE}s deadline")
+    return [f"fetch: {failure}" for failure in failures]
+
+# The poller runs with a one-second interval, no request spacing and a quota it never reaches; CHECK_RETRY_AFTER is what
+# the stand-in's 429 asks for. CHECK_BUSY other-carrier and BA arrivals are listed ahead of the tracked flight, so it is
+# only found on the second page of BA results.
+CHECK_POLL, CHECK_RETRY_AFTER, CHECK_WAIT, CHECK_BUSY, CHECK_QUOTA = 1, 3, 6, 150, 1000
+
+def wait_for(condition, timeout):
+    until = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > until: return False
+        time.sleep(0.1)
+    return True
+
+def check_flight_status(engine):
+    # One flight number flown today and tomorrow into one station, each date with its own ETA, behind a hub's worth of traffic
+    day = datetime.now(timezone.utc).date()
+    nxt = day + timedelta(days=1)
+    busy = [(f"{airline}{n}", "11:00", None) for airline in ("LH", "BA") for n in range(5000, 5000 + CHECK_BUSY)]
+    flights, retry_after = {("LCY", day): busy + [("BA8701", "10:00", "09:10")], ("LCY", nxt): busy + [("BA8701", "12:00", None)]}, {}
+    url, served = serve_flights(flights, retry_after)
+    index = engine.ScheduleIndex(engine.parse_schedule_bytes("\n".join([
+        "BA CITYFLYER EXPORT", "Generated,benchmark", "DATE,FLT,DEP,ARR,STD,STA,AC,REG,Cancellation Reason",
+        f"{day:%d/%m/%y},BA8701,EDI,LCY,08:40,10:05,E90,G-X01,", f"{nxt:%d/%m/%y},BA8701,EDI,LCY,10:40,12:05,E90,G-X01,"]).encode()))
+    saved = engine.FLIGHT_POLL_INTERVAL, engine.FLIGHT_MIN_SPACING, engine.FLIGHT_MONTHLY_QUOTA, engine.FLIGHT_TRACK_TTL
+    engine.FLIGHT_POLL_INTERVAL, engine.FLIGHT_MIN_SPACING, engine.FLIGHT_MONTHLY_QUOTA = CHECK_POLL, 0, 10**9
+    poller, failures = engine.FlightStatusPoller(url, ""), []
+
+    def etas():
+        # {date: (ETA, ATD)} for the inbound legs, through the same merge the popups read
+        return {leg[5]: (leg[7], leg[8]) for leg in index.with_status(*reversed(poller.frame())).get("LCY", [])}
+    def codes(since): return [code for t, *_, code in served if t > since]
+
+    try:
+        poller.track(index.flights_by_arrival())
+        expected = {day: ("10:00", "09:10"), nxt: ("12:00", "")}
+        if not wait_for(lambda: etas() == expected, CHECK_WAIT): failures.append(f"200: legs show {etas()}, expected {expected}")
+        if {d for _, _, d, *_ in served} != {day.isoformat(), nxt.isoformat()}: failures.append(f"requests covered dates {sorted({d for _, _, d, *_ in served})}")
+        if {a for _, _, _, a, *_ in served} != {"BA"}: failures.append(f"requests filtered airlines {sorted({a for _, _, _, a, *_ in served})}, expected BA only")
+        if {o for *_, o, _ in served} != {0, 100}: failures.append(f"requests paged offsets {sorted({o for *_, o, _ in served})}, expected 0 and 100")
+
+        mark = time.time()
+        if not wait_for(lambda: 304 in codes(mark), CHECK_WAIT): failures.append(f"304: unchanged data answered {codes(mark)}, If-None-Match not sent")
+        elif etas() != expected: failures.append(f"304: legs show {etas()} after a not-modified poll, expected {expected}")
+
+        mark = time.time()
+        retry_after["LCY"], flights[("LCY", day)] = CHECK_RETRY_AFTER, busy + [("BA8701", "10:30", "09:10")]
+        if not wait_for(lambda: 429 in codes(mark), CHECK_WAIT): failures.append(f"429: stand-in answered {codes(mark)}")
+        else:
+            limited = max(t for t, *_, code in served if code == 429)
+            if etas() != expected: failures.append(f"429: legs show {etas()} while rate-limited, expected the last statuses")
+            retry_after.clear()
+            if not wait_for(lambda: etas().get(day) == ("10:30", "09:10"), CHECK_RETRY_AFTER + CHECK_WAIT): failures.append(f"429: legs show {etas()} after Retry-After, expected 10:30 today")
+            early = [round(t - limited, 1) for t, *_ in served if limited < t < limited + CHECK_RETRY_AFTER - 0.5]
+            if early: failures.append(f"429: polled again {early}s after a {CHECK_RETRY_AFTER}s Retry-After")
+
+        # A screen on another day adds its job to what is polled; once it stops tracking, only the renewed jobs remain
+        later = nxt + timedelta(days=1)
+        mark = time.time()
+        poller.track({("LCY", later): ["BA8701"]})
+        polled = lambda: {d for t, _, d, *_ in served if t > mark}
+        if not wait_for(lambda: {day.isoformat(), nxt.isoformat(), later.isoformat()} <= polled(), CHECK_WAIT): failures.append(f"union: polled {sorted(polled())} with a second screen on {later}")
+        engine.FLIGHT_TRACK_TTL = CHECK_POLL * 2
+        if not wait_for(lambda: poller.track(index.flights_by_arrival()) or ("LCY", later, "BA") not in poller.wanted, CHECK_WAIT): failures.append(f"expiry: {later} still polled after its screen stopped tracking")
+        elif etas() != {day: ("10:30", "09:10"), nxt: ("12:00", "")}: failures.append(f"expiry: renewed legs show {etas()}")
+
+        # Two jobs of two pages each: a month of rounds at the quota's pace
+        if poller.calls != len(served): failures.append(f"quota: {poller.calls} calls metered, {len(served)} served")
+        engine.FLIGHT_MONTHLY_QUOTA = CHECK_QUOTA
+        if round(poller.poll_interval()) != engine.MONTH_SECONDS * 4 // CHECK_QUOTA: failures.append(f"quota: polls every {poller.poll_interval():.0f}s on {CHECK_QUOTA} calls a month, expected {engine.MONTH_SECONDS * 4 // CHECK_QUOTA}s")
+    finally:
+        with poller.lock: poller.wanted.clear()   # Nothing left to poll while the stages are timed
+        engine.FLIGHT_POLL_INTERVAL, engine.FLIGHT_MIN_SPACING, engine.FLIGHT_MONTHLY_QUOTA, engine.FLIGHT_TRACK_TTL = saved
+    return [f"flights: {failure}" for failure in failures]
+
+
+def run_benchmark(sizes, repeat, delays=None):
+    with open(FIXTURES) as f: fixtures = json.load(f)
+    delays = {} if delays is None else delays
+    os.environ["WX_API_URL"] = serve_fixtures(fixtures, delays)
+    workdir = tempfile.mkdtemp(prefix="hud-bench-")
+    os.chdir(workdir)  # snapshot, schedule and Parquet cache files stay out of the repo
+
+    sys.path.insert(0, REPO_DIR)  # app.py imports hud_engine from beside itself, as `streamlit run` allows
+    import hud_engine as engine
+    app = App()
+    app.run(0)
+    from streamlit.logger import set_log_level
+    set_log_level("error")  # bare-mode "missing ScriptRunContext" warnings on every widget
+    app.run(*sorted(app.sections)[1:])
+    st, airports = app["st"], app["base_airports"]
+    ops_date = app["selected_date"]
+    stations = [iata for iata, info in airports.items() if not info['alt_only']]
+    horizon, xw = app["temp_horizon_hours"], app["temp_xw_limit"]
+
+    results = {"fetch": timed(lambda: engine.get_raw_weather_master(airports), 1)}
+    failures = check_fetch_deadline(engine, airports, delays, {iata for iata, wx in app["raw_weather_bundle"].items() if wx.status == "online"})
+    failures += check_flight_status(engine)
+    failures += check_overnight_legs(engine, stations, ops_date)
+    results["process"] = timed(lambda: engine.process_weather_for_horizon(engine.HazardTable(app["raw_weather_bundle"], airports), horizon, xw), repeat)
+    for rows in sizes:
+        data = synthetic_schedule(rows, stations, ops_date)
+        app["schedule_store"].publish(data)
+
+        def schedule():
+            df = engine.parse_schedule_bytes(data)
+            engine.ScheduleIndex(df[df['DATE_OBJ'] == ops_date])
+        results[f"schedule@{rows}"] = timed(schedule, repeat)
+
+        app.run(7)
+        def cold():
+            engine.memory.clear()
+            app["get_alert_board"].clear()
+        results[f"markers@{rows}"] = timed(lambda: app.run(8), repeat, cold)
+        alerts = list(app["metar_alerts"]) + list(app["taf_alerts"]) or stations
+        def brief():
+            st.session_state.investigate_iata = alerts[0]
+            app.run(9)
+        results[f"brief@{rows}"] = timed(brief, repeat, cold)
+        st.session_state.investigate_iata = None
+        results[f"folium@{rows}"] = timed(lambda: app.run(12), repeat)
+    return results, failures
+
+
+# --- Baseline -----------------------------------------------------------------
+def compare(results, baseline, tolerance, floor):
+    # A stage regresses when it is both `tolerance` times slower and at least `floor` seconds slower than baseline
+    flags = []
+    for stage, secs in results.items():
+        base = baseline.get(stage)
+        if base is not None and secs > base * tolerance and secs - base > floor: flags.append((stage, base, secs))
+    return flags
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline HUD benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="schedule rows to generate")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage; the median is reported")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    parser.add_argument("--floor", type=float, default=0.005, help="ignore slowdowns smaller than this many seconds")
+    parser.add_argument("--record", action="store_true", help="re-record fixtures from aviationweather.gov first")
+    parser.add_argument("--delay", action="append", default=[], metavar="ICAO=SECONDS", help="inject latency into one station's reports")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        import csv
+        with open(os.path.join(os.path.dirname(BENCH_DIR), "data", "network.csv")) as f:
+            record_fixtures([row['icao'] for row in csv.DictReader(f)])
+
+    delays = {icao.upper(): float(secs) for icao, secs in (d.split("=", 1) for d in args.delay)}
+    results, failures = run_benchmark(args.sizes, args.repeat, delays)
+    for stage, secs in results.items(): print(f"{stage:<20}{secs * 1000:>10.1f} ms")
+    for failure in failures: print(f"❌ CHECK {failure}")
+    if not failures: print("✅ Fetch deadline, flight status and overnight leg checks passed")
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w") as f: json.dump(results, f, indent=1)
+        print(f"💾 Baseline written to {args.baseline}")
+        return 1 if failures else 0
+    with open(args.baseline) as f: flags = compare(results, json.load(f), args.tolerance, args.floor)
+    for stage, base, secs in flags: print(f"⚠️ REGRESSION {stage}: {base * 1000:.1f} ms -> {secs * 1000:.1f} ms")
+    if not flags: print("✅ No regressions against baseline")
+    return 1 if flags or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
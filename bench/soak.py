@@ -0,0 +1,126 @@
+"""Soak test for long-running HUD processes.
+
+Replays a week of 15-minute weather cycles through app.py in one process, publishing an edited schedule every few hours,
+and samples resident memory as it goes. Every cycle is a new snapshot (a share of stations get new reports), is appended to
+the weather history and is rendered like a screen would (sections 5 onwards, so each render picks up the new snapshot), so
+schedule frames, day indexes, hazard tables, leg flags and views all churn through the memory budget. Fails unless the
+budget evicted, its total never exceeded the budget, and resident memory stopped climbing over the last quarter of the run.
+
+Usage:
+    python bench/soak.py                              # 7 days, upload every 6h, 20k-row schedules, 32 MB budget
+    python bench/soak.py --days 2 --rows 5000 --budget-mb 8
+"""
+import argparse
+import copy
+import gc
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmark import FIXTURES, REPO_DIR, App, serve_fixtures, synthetic_schedule
+
+CYCLE = timedelta(minutes=15)
+
+
+def rss_mb():
+    # Current resident set from /proc where there is one, else the peak (ru_maxrss is KB on Linux, bytes on macOS)
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError: return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+
+def next_bundle(engine, bundle, at, rng, share=0.3):
+    # A share of stations publish a new METAR (new issue time and wind); the rest repeat their last report unchanged
+    out = dict(bundle)
+    for iata in rng.sample(sorted(bundle), max(1, int(len(bundle) * share))):
+        wx = copy.copy(bundle[iata])
+        if wx.status != "online": continue
+        wx.w_spd = rng.choice((5, 10, 15, 20, 30))
+        wx.raw_m = " ".join([wx.raw_m.split(" ", 1)[0], f"{at:%d%H%M}Z"] + wx.raw_m.split(" ")[2:])
+        out[iata] = wx
+    return engine.WeatherSnapshot(0, at, out)
+
+def edited_schedule(base, rng, share=0.01):
+    # The previous upload with ~1% of legs retimed, the way a day's disruption edits an export
+    lines = base.decode().splitlines()
+    for n in rng.sample(range(3, len(lines)), max(1, int((len(lines) - 3) * share))):
+        row = lines[n].split(",")
+        row[4] = f"{rng.randint(0, 23):02d}:{rng.choice((0, 15, 30, 45)):02d}"
+        lines[n] = ",".join(row)
+    return ("\n".join(lines) + "\n").encode()
+
+def run_soak(days, upload_hours, rows, budget_mb, sample_every):
+    os.environ["HUD_MEMORY_MB"] = str(budget_mb)
+    with open(FIXTURES) as f: fixtures = json.load(f)
+    os.environ["WX_API_URL"] = serve_fixtures(fixtures)
+    os.chdir(tempfile.mkdtemp(prefix="hud-soak-"))
+    sys.path.insert(0, REPO_DIR)
+    import hud_engine as engine
+
+    app = App()
+    app.run(0)
+    from streamlit.logger import set_log_level
+    set_log_level("error")
+    app.run(*sorted(app.sections)[1:])
+    refresher, store, airports = app["wx_refresher"], app["schedule_store"], app["base_airports"]
+    stations = [iata for iata, info in airports.items() if not info['alt_only']]
+    rng = random.Random(7)
+
+    cycles = int(timedelta(days=days) / CYCLE)
+    upload_every = max(1, int(timedelta(hours=upload_hours) / CYCLE))
+    start = datetime.now(timezone.utc) - timedelta(days=days)
+    schedule = synthetic_schedule(rows, stations, app["selected_date"])
+    snapshot = refresher.snapshot()
+    samples, t0 = [], time.perf_counter()
+    for n in range(cycles):
+        at = start + n * CYCLE
+        if n % upload_every == 0:
+            schedule = edited_schedule(schedule, rng)
+            store.publish(schedule)
+        nxt = next_bundle(engine, snapshot.stations, at, rng)
+        snapshot = engine.WeatherSnapshot(snapshot.version + 1, at, nxt.stations, engine.changed_stations(snapshot.stations, nxt.stations))
+        refresher.current = snapshot
+        refresher.history.append(snapshot)
+        app.run(*sorted(app.sections)[5:])
+        if n % sample_every == 0 or n == cycles - 1:
+            gc.collect()
+            usage = engine.memory.usage()
+            samples.append((n, rss_mb(), usage["total"] / 2**20, sum(c["entries"] for c in usage["caches"].values()), sum(c["evictions"] for c in usage["caches"].values())))
+            print(f"cycle {n:>5} {at:%d/%m %H:%MZ}  rss {samples[-1][1]:7.1f} MB  caches {samples[-1][2]:6.1f} MB  "
+                  f"entries {samples[-1][3]:>5}  evicted {samples[-1][4]:>6}  ({time.perf_counter() - t0:.0f}s)", flush=True)
+    for cache, u in engine.memory.usage()["caches"].items():
+        print(f"  {cache:<16}{u['entries']:>6} entries {u['bytes'] / 2**20:>8.2f} MB {u['evictions']:>6} evicted")
+    return samples, engine.memory.budget / 2**20
+
+def plateaued(samples, tolerance):
+    # Resident memory over the last quarter may not exceed what it was at the half-way mark by more than `tolerance`
+    half = samples[len(samples) // 2][1]
+    tail = max(rss for _, rss, *_ in samples[len(samples) * 3 // 4:])
+    return tail <= half * (1 + tolerance), half, tail
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HUD memory soak test")
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--upload-hours", type=float, default=6, help="hours between schedule uploads")
+    parser.add_argument("--rows", type=int, default=20_000, help="schedule rows")
+    parser.add_argument("--budget-mb", type=float, default=32, help="HUD_MEMORY_MB for the run")
+    parser.add_argument("--sample-every", type=int, default=48, help="cycles between memory samples")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed RSS growth over the second half")
+    args = parser.parse_args(argv)
+
+    samples, budget = run_soak(args.days, args.upload_hours, args.rows, args.budget_mb, args.sample_every)
+    ok, half, tail = plateaued(samples, args.tolerance)
+    print(f"{'✅ Plateaued' if ok else '⚠️ STILL GROWING'}: {half:.1f} MB at half-way, {tail:.1f} MB peak over the last quarter")
+    # A flat RSS alone proves little (imports dominate it): the budget must have been reached, and held
+    over = [(n, round(total, 1)) for n, _, total, _, _ in samples if total > budget]
+    if over: print(f"⚠️ OVER BUDGET ({budget:.0f} MB) at cycles {over}")
+    if not samples[-1][4]: print(f"⚠️ NO EVICTIONS: the caches never reached the {budget:.0f} MB budget, so it was not exercised")
+    return 0 if ok and not over and samples[-1][4] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
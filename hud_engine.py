@@ -0,0 +1,1342 @@
+# Weather, schedule and hazard pipeline behind the HUD, importable without Streamlit or folium.
+# app.py wraps these in st.cache_* and renders them; `python hud_engine.py` runs the same pipeline headless for cron jobs.
+import argparse
+import collections
+import math
+import re
+import functools
+import itertools
+import io
+import os
+import sys
+import time
+import hashlib
+import json
+import threading
+import shutil
+import requests
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta, timezone
+
+# 1. UTILITIES & ROBUST CSV LOADER
+# Pipeline instrumentation: off unless HUD_METRICS=1, in which case every render and weather cycle rewrites
+# <HUD_METRICS_FILE>.json and .prom (Prometheus text format) and a diagnostics expander appears in the sidebar
+METRICS_ENABLED = os.environ.get("HUD_METRICS", "0") == "1"
+METRICS_FILE = os.environ.get("HUD_METRICS_FILE", "hud_metrics")
+
+class PipelineMetrics:
+    # Process-wide stage timings, fetch latency, cache lookups/misses and payload sizes. Disabled hooks return at once.
+    def __init__(self, enabled):
+        self.enabled, self.lock = enabled, threading.RLock()
+        self.stages, self.lookups, self.misses, self.sizes, self.fetch, self.memory = {}, {}, {}, {}, {}, {}
+
+    def start(self):
+        return time.perf_counter() if self.enabled else None
+
+    def stop(self, stage, started):
+        if started is None: return
+        secs = time.perf_counter() - started
+        with self.lock:
+            _, total, runs = self.stages.get(stage, (0.0, 0.0, 0))
+            self.stages[stage] = (secs, total + secs, runs + 1)
+
+    def lookup(self, cache):
+        # Counted where a cache is consulted; miss() is counted where the cached work actually runs
+        if self.enabled:
+            with self.lock: self.lookups[cache] = self.lookups.get(cache, 0) + 1
+
+    def miss(self, cache):
+        if self.enabled:
+            with self.lock: self.misses[cache] = self.misses.get(cache, 0) + 1
+
+    def size(self, payload, nbytes):
+        if self.enabled: self.sizes[payload] = nbytes
+
+    def record_fetch(self, bundle):
+        if self.enabled:
+            with self.lock: self.fetch = {iata: (wx.latency, wx.error) for iata, wx in bundle.items()}
+
+    def lru(self, cache, info):
+        # functools.lru_cache keeps its own counters
+        if self.enabled:
+            with self.lock: self.lookups[cache], self.misses[cache] = info.hits + info.misses, info.misses
+
+    def memory_usage(self, usage):
+        if self.enabled:
+            with self.lock: self.memory = usage
+
+    def to_dict(self):
+        with self.lock:
+            return {"stages": {k: {"last_s": round(v[0], 4), "total_s": round(v[1], 4), "runs": v[2]} for k, v in self.stages.items()},
+                    "caches": {k: {"lookups": n, "misses": self.misses.get(k, 0), "hits": n - self.misses.get(k, 0)} for k, n in self.lookups.items()},
+                    "payload_bytes": dict(self.sizes), "memory": dict(self.memory),
+                    "fetch": {iata: {"latency_s": lat, "error": err} for iata, (lat, err) in self.fetch.items()}}
+
+    def to_prometheus(self):
+        d = self.to_dict()
+        lines = ["# TYPE hud_stage_seconds gauge"] + [f'hud_stage_seconds{{stage="{k}"}} {v["last_s"]}' for k, v in d["stages"].items()]
+        lines += ["# TYPE hud_stage_seconds_total counter"] + [f'hud_stage_seconds_total{{stage="{k}"}} {v["total_s"]}' for k, v in d["stages"].items()]
+        lines += ["# TYPE hud_stage_runs_total counter"] + [f'hud_stage_runs_total{{stage="{k}"}} {v["runs"]}' for k, v in d["stages"].items()]
+        lines += ["# TYPE hud_cache_requests_total counter"] + [f'hud_cache_requests_total{{cache="{k}",result="{r}"}} {v[n]}' for k, v in d["caches"].items() for r, n in (("hit", "hits"), ("miss", "misses"))]
+        lines += ["# TYPE hud_payload_bytes gauge"] + [f'hud_payload_bytes{{payload="{k}"}} {v}' for k, v in d["payload_bytes"].items()]
+        lines += ["# TYPE hud_fetch_latency_seconds gauge"] + [f'hud_fetch_latency_seconds{{station="{k}"}} {v["latency_s"] or 0}' for k, v in d["fetch"].items()]
+        lines += ["# TYPE hud_fetch_failures gauge", f'hud_fetch_failures {sum(1 for v in d["fetch"].values() if v["error"])}']
+        if d["memory"]:
+            caches = d["memory"]["caches"]
+            lines += ["# TYPE hud_cache_bytes gauge"] + [f'hud_cache_bytes{{cache="{k}"}} {v["bytes"]}' for k, v in caches.items()]
+            lines += ["# TYPE hud_cache_entries gauge"] + [f'hud_cache_entries{{cache="{k}"}} {v["entries"]}' for k, v in caches.items()]
+            lines += ["# TYPE hud_cache_evictions_total counter"] + [f'hud_cache_evictions_total{{cache="{k}"}} {v["evictions"]}' for k, v in caches.items()]
+            lines += ["# TYPE hud_memory_budget_bytes gauge", f'hud_memory_budget_bytes {d["memory"]["budget"]}']
+        return "\n".join(lines) + "\n"
+
+    def flush(self, path=METRICS_FILE):
+        if not self.enabled: return
+        try:
+            with self.lock:
+                for ext, body in ((".json", json.dumps(self.to_dict(), indent=1)), (".prom", self.to_prometheus())):
+                    with open(path + ext + ".tmp", "w") as f: f.write(body)
+                    os.replace(path + ext + ".tmp", path + ext)
+        except OSError: pass
+
+metrics = PipelineMetrics(METRICS_ENABLED)
+
+# Memory budget for long-running kiosks: schedule frames, day indexes, hazard tables, history days and network views all
+# live in one size-aware LRU, so the process settles at HUD_MEMORY_MB however many uploads, cycles and screens it sees
+MEMORY_BUDGET_MB = float(os.environ.get("HUD_MEMORY_MB", "512"))
+SIZE_SAMPLE = 256   # Containers larger than this are sized from an evenly spaced sample
+
+def deep_size(obj, seen=None):
+    # Approximate retained bytes: exact for NumPy/pandas buffers, sys.getsizeof for the Python objects around them
+    seen = set() if seen is None else seen
+    if id(obj) in seen: return 0
+    seen.add(id(obj))
+    if isinstance(obj, pd.DataFrame): return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)): return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray): return obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool, type(None))): return size
+    if isinstance(obj, dict): items = list(obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, collections.deque)): items = list(obj)
+    elif hasattr(obj, "__dict__"): return size + deep_size(vars(obj), seen)
+    elif hasattr(obj, "__slots__"): items = [getattr(obj, a, None) for a in obj.__slots__]
+    else: return size
+    step = max(1, len(items) // SIZE_SAMPLE)
+    return size + sum(deep_size(x, seen) for x in items[::step]) * step
+
+class MemoryBudget:
+    # One LRU shared by the process-wide caches. Entries are charged at their deep_size when stored, and the least recently
+    # used are dropped, from whichever cache, until the total fits. Each key is built once; concurrent callers wait for it.
+    # An entry is only charged once, so cached objects never grow memos of their own: what they derive later (a table's leg
+    # flags, an index's merged statuses) is stored as its own entry under the object's owner() id.
+    def __init__(self, budget_bytes):
+        self.budget, self.lock = int(budget_bytes), threading.Lock()
+        self.entries = collections.OrderedDict()   # (cache, key) -> (value, nbytes)
+        self.building, self.evictions, self.total = {}, collections.Counter(), 0
+        self.owners = itertools.count()
+
+    def owner(self):
+        # A process-unique id for keys derived from one object; unlike id(), never reused once that object is gone
+        return next(self.owners)
+
+    def get(self, cache, key):
+        metrics.lookup(cache)
+        with self.lock:
+            hit = self.entries.get((cache, key))
+            if hit is None: metrics.miss(cache); return None
+            self.entries.move_to_end((cache, key))
+            return hit[0]
+
+    def get_or_build(self, cache, key, build):
+        value = self.get(cache, key)
+        if value is not None: return value
+        with self.lock: build_lock = self.building.setdefault((cache, key), threading.Lock())
+        with build_lock:
+            with self.lock: hit = self.entries.get((cache, key))
+            if hit is not None: return hit[0]
+            value = build()
+            self.put(cache, key, value)
+        with self.lock: self.building.pop((cache, key), None)
+        return value
+
+    def put(self, cache, key, value):
+        nbytes = deep_size(value)
+        with self.lock:
+            if (cache, key) in self.entries: self.total -= self.entries.pop((cache, key))[1]
+            if nbytes > self.budget: return   # Served once, never kept
+            self.entries[(cache, key)], self.total = (value, nbytes), self.total + nbytes
+            while self.total > self.budget:
+                (dropped, _), (_, freed) = self.entries.popitem(last=False)
+                self.total -= freed
+                self.evictions[dropped] += 1
+
+    def clear(self):
+        # Drops every entry (eviction counts are kept); the benchmark times cold builds this way
+        with self.lock: self.entries.clear(); self.total = 0
+
+    def usage(self):
+        with self.lock:
+            caches = {}
+            for (cache, _), (_, nbytes) in self.entries.items():
+                entries, total = caches.get(cache, (0, 0))
+                caches[cache] = (entries + 1, total + nbytes)
+            names = set(caches) | set(self.evictions)
+            return {"budget": self.budget, "total": self.total,
+                    "caches": {c: {"entries": caches.get(c, (0, 0))[0], "bytes": caches.get(c, (0, 0))[1], "evictions": self.evictions[c]} for c in sorted(names)}}
+
+memory = MemoryBudget(MEMORY_BUDGET_MB * 2**20)
+
+def get_safe_num(val, default=0):
+    if val is None: return default
+    try: return float(val)
+    except (ValueError, TypeError): return default
+
+def calculate_xwind(wind_dir, wind_spd, rwy_hdg):
+    if wind_dir is None or wind_spd is None or rwy_hdg is None: return 0
+    angle = math.radians(wind_dir - rwy_hdg)
+    return round(abs(wind_spd * math.sin(angle)))
+
+def best_runway(wind_dir, wind_spd, runways):
+    # (designators, crosswind) for the runway with the least crosswind
+    return min(((name, calculate_xwind(wind_dir, wind_spd, hdg)) for name, hdg in runways), key=lambda r: r[1], default=("--/--", 0))
+
+def runway_headings(infos):
+    # (stations x most runways) heading matrix, NaN-padded
+    width = max((len(info['rwys']) for info in infos), default=1)
+    return np.array([[hdg for _, hdg in info['rwys']] + [np.nan] * (width - len(info['rwys'])) for info in infos], dtype=float).reshape(len(infos), width)
+
+def best_xwind(wind_dir, wind_spd, headings):
+    return np.fmin.reduce(np.round(np.abs(wind_spd[:, None] * np.sin(np.radians(wind_dir[:, None] - headings)))), axis=1)
+
+# One compiled scan per report: every hazard-relevant token is found once, classified by group and optionally bolded
+TK_CHANGE, TK_GUST, TK_WIND, TK_CLOUD, TK_VIS, TK_FOG, TK_WINTER, TK_TSRA = 1, 2, 4, 8, 16, 32, 64, 128
+HAZARD_TOKEN_RE = re.compile(r"""
+     (?P<period>\b\d{4}/\d{4}\b)
+    |(?P<change>\b(?:TEMPO|BECMG|PROB\d{2})\b)
+    |(?P<gust>\b\d{5}G\d{2,3}KT\b)
+    |(?P<wind>\b\d{3}[2-9]\dKT\b)
+    |(?P<cloud>\b(?:BKN|OVC)(?:00\d|01[0-5])\b)
+    |(?P<vis>\b0\d{3}\b)
+    |(?P<fog>\bFG\b)
+    |(?P<fog_word>\bFOG\b)
+    |(?P<tsra>\b(?:VC)?TS\w*)
+    |(?P<winter>[-+]SN\w*|\bSN\b|\bFZ\w*)
+""", re.X)
+TOKEN_FLAGS = {'period': TK_CHANGE, 'change': TK_CHANGE, 'gust': TK_GUST, 'wind': TK_WIND, 'cloud': TK_CLOUD, 'vis': TK_VIS, 'fog': TK_FOG, 'fog_word': 0, 'tsra': TK_TSRA, 'winter': TK_WINTER}
+# Weather groups are only bolded as whole words; the rest of the matches are bolded by group
+BOLD_WX_WORDS = {'FG', 'TS', 'TSRA', 'SN', '-SN', '+SN', 'FZRA', 'FZDZ'}
+
+@functools.lru_cache(maxsize=4096)
+def scan_hazards(text):
+    # (flag bits, spans to bold) for a raw report or TAF line; memoized so an unchanged report is never rescanned
+    flags, spans = 0, []
+    for m in HAZARD_TOKEN_RE.finditer(text or ""):
+        flags |= TOKEN_FLAGS[m.lastgroup]
+        if m.lastgroup not in ('tsra', 'winter') or m.group() in BOLD_WX_WORDS: spans.append(m.span())
+    return flags, tuple(spans)
+
+@functools.lru_cache(maxsize=1024)
+def bold_hazard(text):
+    if not text or text == "N/A": return text
+    out, pos = [], 0
+    for start, end in scan_hazards(text)[1]:
+        out += [text[pos:start], "<b>", text[start:end], "</b>"]
+        pos = end
+    return "".join(out) + text[pos:]
+
+SCHEDULE_FILE = "active_schedule.csv"     # The live schedule; only ever replaced whole, via ScheduleStore.publish
+SCHEDULE_CACHE_DIR = ".schedule_cache"   # Normalised schedules as Parquet, named by content hash
+SCHEDULE_MANIFEST = "manifest.json"      # Version list inside SCHEDULE_CACHE_DIR
+SCHEDULE_VERSIONS_KEPT = 50              # Older versions' frames and diffs are pruned on publish
+SCHEDULE_DIFF_COLS = ['DEP', 'ARR', 'STD', 'STA', 'AC', 'Cancellation Reason']
+HEADER_SCAN_BYTES = 64 * 1024              # Export preambles are a few lines; never scan the whole file for the header
+SCHEDULE_CATEGORIES = ['DEP', 'ARR', 'AC']
+SCHEDULE_COMPACT = ['DATE', 'FLT', 'STD', 'STA', 'REG', 'Cancellation Reason', 'DATE_OBJ']   # Low-cardinality text, held as categoricals
+
+def parse_hhmm_minutes(series):
+    # A schedule only has a few hundred distinct times, so parse each one once and broadcast back (NaN for blanks)
+    codes, uniques = pd.factorize(series)
+    hhmm = pd.to_numeric(pd.Series(uniques, dtype=str).str.strip().str.replace(':', '', regex=False), errors='coerce').to_numpy(dtype=float)
+    return pd.Series(np.append((hhmm // 100) * 60 + hhmm % 100, np.nan)[codes], index=series.index)
+
+def find_header_row(file_bytes):
+    for i, line in enumerate(file_bytes[:HEADER_SCAN_BYTES].decode('utf-8', errors='ignore').splitlines()):
+        if 'DATE' in line and 'FLT' in line and 'DEP' in line and 'ARR' in line: return i
+    return 0
+
+def parse_schedule_bytes(file_bytes):
+    # Everything is read as text and typed explicitly, so STA "0355" stays "0355" and FLT never turns into a float
+    df = pd.read_csv(io.BytesIO(file_bytes), skiprows=find_header_row(file_bytes), dtype=str, on_bad_lines='skip', encoding='utf-8')
+    df = df.dropna(subset=['FLT'])
+    for col in SCHEDULE_CATEGORIES:
+        if col in df.columns: df[col] = df[col].str.strip().str.upper().astype('category')
+    
+    date_dt = pd.to_datetime(df['DATE'], format='%d/%m/%y', errors='coerce')
+    missed = date_dt.isna() & df['DATE'].notna()
+    if missed.any(): date_dt.loc[missed] = pd.to_datetime(df.loc[missed, 'DATE'], dayfirst=True, errors='coerce')
+    df['DATE_OBJ'] = date_dt.dt.date
+    for col in ('STD', 'STA'):
+        if col in df.columns: df[f'{col}_DT'] = date_dt + pd.to_timedelta(parse_hhmm_minutes(df[col]), unit='min')
+    return roll_overnight(df).reset_index(drop=True)
+
+def roll_overnight(df):
+    # DATE is the departure day, so an STA earlier than its STD (23:00-01:30) arrives the next day
+    if 'STD_DT' in df.columns and 'STA_DT' in df.columns: df.loc[df['STA_DT'] < df['STD_DT'], 'STA_DT'] += pd.Timedelta(days=1)
+    return df
+
+def compact_schedule(df):
+    # A season repeats the same few thousand flight numbers, dates and times; as categoricals a frame is roughly a quarter
+    # of its size as object/string columns. Applied after Parquet reads too, which come back with dates as objects.
+    for col in SCHEDULE_COMPACT:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype): df[col] = df[col].astype('category')
+    return roll_overnight(df)   # Parquet written before overnight legs were rolled forward still reads back right
+
+def load_schedule(file_bytes, schedule_hash, cache_dir=SCHEDULE_CACHE_DIR):
+    # Parsed frame from the Parquet cache when this exact file has been seen before, else parsed and cached
+    cache_path = os.path.join(cache_dir, f"{schedule_hash}.parquet")
+    metrics.lookup("schedule_parquet")
+    try: return compact_schedule(pd.read_parquet(cache_path))
+    except Exception: pass
+    metrics.miss("schedule_parquet")
+    try: df = compact_schedule(parse_schedule_bytes(file_bytes))
+    except Exception: return pd.DataFrame()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        df.to_parquet(cache_path + ".tmp", index=False)
+        os.replace(cache_path + ".tmp", cache_path)
+    except Exception: pass
+    return df
+
+def atomic_write(path, data):
+    # Readers see the old file or the new one, never a partial write
+    with open(path + ".tmp", "wb") as f: f.write(data)
+    os.replace(path + ".tmp", path)
+
+def schedule_diff(old, new):
+    # Row-level delta keyed on FLT+DATE (repeats of a key are paired in file order): one row per added, removed or changed leg
+    def keyed(df):
+        cols = [c for c in SCHEDULE_DIFF_COLS if c in df.columns]
+        out = pd.DataFrame({c: df[c].astype(object).where(df[c].notna(), "").astype(str).str.strip() for c in ['FLT'] + cols})
+        out['DATE_OBJ'] = df['DATE_OBJ'].astype(object)
+        out['N'] = out.groupby(['FLT', 'DATE_OBJ'], dropna=False).cumcount()
+        return out.set_index(['FLT', 'DATE_OBJ', 'N'])
+    o, n = keyed(new.iloc[0:0] if old.empty else old), keyed(new)
+    cols = [c for c in SCHEDULE_DIFF_COLS if c in o.columns and c in n.columns]
+    m = o[cols].join(n[cols], how='outer', lsuffix='_OLD', rsuffix='_NEW')
+    added, removed = m['DEP_OLD'].isna().to_numpy(), m['DEP_NEW'].isna().to_numpy()
+    m = m.fillna("")
+    moved = {c: ((m[f'{c}_OLD'] != m[f'{c}_NEW']).to_numpy() & ~added & ~removed) for c in cols}
+    keep = added | removed | np.logical_or.reduce(list(moved.values()))
+    m, added, removed, moved = m[keep], added[keep], removed[keep], {c: v[keep] for c, v in moved.items()}
+    
+    # Cancellation flips and pure retimes get their own labels; anything else that moved is CHANGED, with old→new per column
+    canc_old = m['Cancellation Reason_OLD'] != "" if 'Cancellation Reason' in cols else pd.Series(False, index=m.index)
+    canc_new = m['Cancellation Reason_NEW'] != "" if 'Cancellation Reason' in cols else pd.Series(False, index=m.index)
+    timing = moved.get('STD', False) | moved.get('STA', False)
+    other = np.logical_or.reduce([v for c, v in moved.items() if c not in ('STD', 'STA')] or [np.zeros(len(m), dtype=bool)])
+    change = np.select([added, removed, (canc_old != canc_new).to_numpy() & canc_new.to_numpy(), (canc_old != canc_new).to_numpy(), timing & ~other],
+                       ["ADDED", "REMOVED", "CANCELLED", "REINSTATED", "RETIMED"], "CHANGED")
+    detail = pd.Series("", index=m.index)
+    for c in cols:
+        part = (c + " " + m[f'{c}_OLD'].replace("", "-") + "→" + m[f'{c}_NEW'].replace("", "-")).where(moved[c], "")
+        detail = detail + np.where((detail != "") & (part != ""), ", ", "") + part
+    side = lambda c: m[f'{c}_OLD'].where(removed, m[f'{c}_NEW'])
+    span = side('STD') + "-" + side('STA') if 'STD' in cols and 'STA' in cols else ""
+    detail = detail.where(~(added | removed), span)
+    return pd.DataFrame({"DATE": m.index.get_level_values('DATE_OBJ'), "FLT": m.index.get_level_values('FLT'), "DEP": side('DEP').to_numpy(),
+                         "ARR": side('ARR').to_numpy(), "CHANGE": change, "DETAIL": detail.to_numpy()}).sort_values(['DATE', 'FLT'], kind='stable', ignore_index=True)
+
+class ScheduleStore:
+    # Versioned, content-addressed schedules under SCHEDULE_CACHE_DIR. Each version's parsed frame is <hash>.parquet (the
+    # cache load_schedule keeps anyway), v<N>-diff.parquet is its row delta against the version before, and the manifest lists
+    # versions in order with the ops dates each one touched, so a day an upload did not change keeps its index.
+    def __init__(self, root=SCHEDULE_CACHE_DIR, active_file=SCHEDULE_FILE):
+        self.root, self.active_file, self.lock = root, active_file, threading.Lock()
+        try:
+            with open(os.path.join(root, SCHEDULE_MANIFEST)) as f: self.versions = json.load(f)
+        except (OSError, ValueError): self.versions = []
+        # Adopt a schedule file written outside the store (older deployments, a hand-copied export) as a new version
+        if os.path.exists(active_file):
+            with open(active_file, "rb") as f: raw = f.read()
+            try: self.publish(raw)
+            except ValueError: pass
+
+    @property
+    def head(self): return self.versions[-1] if self.versions else None
+
+    def publish(self, file_bytes):
+        # The new version's manifest entry, or None when these exact bytes are already live
+        schedule_hash = hashlib.sha1(file_bytes).hexdigest()
+        with self.lock:
+            if self.head and self.head['hash'] == schedule_hash: return None
+            os.makedirs(self.root, exist_ok=True)
+            df = load_schedule(file_bytes, schedule_hash, self.root)
+            if df.empty: raise ValueError("No flights found in the uploaded schedule")
+            diff = schedule_diff(self.frame(self.head['hash']), df) if self.head else pd.DataFrame(columns=['DATE', 'FLT', 'DEP', 'ARR', 'CHANGE', 'DETAIL'])
+            version = self.head['version'] + 1 if self.head else 1
+            diff.to_parquet(self.diff_path(version) + ".tmp", index=False)
+            os.replace(self.diff_path(version) + ".tmp", self.diff_path(version))
+            atomic_write(self.active_file, file_bytes)
+            entry = {"version": version, "hash": schedule_hash, "published_at": datetime.now(timezone.utc).isoformat(), "bytes": len(file_bytes),
+                     "rows": len(df), "dates": None if version == 1 else sorted({d.isoformat() for d in diff['DATE'].dropna()})}
+            self.versions.append(entry)
+            self.prune()
+            atomic_write(os.path.join(self.root, SCHEDULE_MANIFEST), json.dumps(self.versions, indent=1).encode())
+            return entry
+
+    def prune(self):
+        dropped, self.versions = self.versions[:-SCHEDULE_VERSIONS_KEPT], self.versions[-SCHEDULE_VERSIONS_KEPT:]
+        live = {v['hash'] for v in self.versions}
+        for v in dropped:
+            for path in ([os.path.join(self.root, f"{v['hash']}.parquet")] if v['hash'] not in live else []) + [self.diff_path(v['version'])]:
+                try: os.remove(path)
+                except OSError: pass
+
+    def diff_path(self, version): return os.path.join(self.root, f"v{version}-diff.parquet")
+
+    def frame(self, schedule_hash):
+        try: return compact_schedule(pd.read_parquet(os.path.join(self.root, f"{schedule_hash}.parquet")))
+        except Exception: return pd.DataFrame()
+
+    def changes(self, entry=None):
+        # Row delta between `entry` (default: the live version) and the version before it. The sidebar shows the live one on
+        # every rerun, so each version's delta is read once and kept while the memory budget allows
+        entry = entry or self.head
+        if not entry: return pd.DataFrame()
+        try: return memory.get_or_build("schedule_changes", (self.root, entry['version'], entry['hash']), lambda: pd.read_parquet(self.diff_path(entry['version'])))
+        except Exception: return pd.DataFrame()
+
+    def date_key(self, schedule_hash, ops_date):
+        # Hash of the oldest version whose rows for ops_date match this one's, so per-day indexes and views outlive uploads
+        # that did not touch that day
+        pos = max((n for n, v in enumerate(self.versions) if v['hash'] == schedule_hash), default=None)
+        if pos is None: return schedule_hash
+        while pos > 0 and self.versions[pos]['dates'] is not None and ops_date.isoformat() not in self.versions[pos]['dates']: pos -= 1
+        return self.versions[pos]['hash']
+
+CF_AC_TYPES, EF_AC_TYPES = ('E90',), ['31E', '32E', '320', '319']
+
+def airport_fleet(info):
+    return (info.get('fleet') in ['Cityflyer', 'Both'], info.get('fleet') in ['Euroflyer', 'Both'])
+
+class ScheduleIndex:
+    # One pass over a day's schedule so the marker loop only touches the flights at its own station
+    def __init__(self, df):
+        self.stations = set(df['DEP'].dropna()) | set(df['ARR'].dropna())
+        
+        # Fleet per station from the AC column: stations with no recognisable type fall back to the airport table
+        self.fleet = {}
+        if 'AC' in df.columns:
+            legs = pd.concat([df[['DEP', 'AC']].set_axis(['STN', 'AC'], axis=1), df[['ARR', 'AC']].set_axis(['STN', 'AC'], axis=1)]).dropna(subset=['AC'])
+            ac = legs['AC'].astype(str).str.upper()
+            legs = legs.assign(CF=ac.str.contains('|'.join(CF_AC_TYPES), regex=True), EF=ac.isin(EF_AC_TYPES))
+            for stn, cf, ef in legs.groupby('STN', observed=True)[['CF', 'EF']].any().itertuples():
+                if cf or ef: self.fleet[stn] = (bool(cf), bool(ef))
+        
+        # Inbound legs per ARR (pre-sorted by parsed STA) and outbound legs per DEP (by STD), as plain tuples for the popup tables.
+        # Times travel as UTC epoch seconds (_TS), so an overnight arrival sorts and expires on the day it actually lands.
+        # LEG is the leg's row in arrivals/departures, which is also its slot in the per-flight hazard arrays.
+        self.inbound, self.outbound, self.arrivals, self.departures, self.owner = {}, {}, None, None, memory.owner()
+        canc = df['Cancellation Reason'] if 'Cancellation Reason' in df.columns else pd.Series(None, index=df.index, dtype=object)
+        legs = pd.DataFrame({"ARR": df['ARR'], "FLT": df['FLT'].astype(str).str.strip(), "DEP": df['DEP'], "DATE_OBJ": df['DATE_OBJ'],
+                             "CANC": canc.notna() & (canc.astype(str).str.strip() != "")})
+        for col, attr in (('STA', 'arrivals'), ('STD', 'departures')):
+            if col not in df.columns: continue
+            timed = legs.assign(**{col: df[col].astype(str).str.strip(), f"{col}_TS": (df[f'{col}_DT'] - pd.Timestamp(0)) / pd.Timedelta(seconds=1)})
+            timed = timed.sort_values(by=f"{col}_TS", kind='stable', na_position='last', ignore_index=True)
+            setattr(self, attr, timed.assign(LEG=np.arange(len(timed))))
+        if self.arrivals is not None: self.inbound = self.group_inbound(self.arrivals.assign(DUE_TS=self.arrivals['STA_TS'], ETA="", ATD=""))
+        if self.departures is not None:
+            self.outbound = {stn: list(grp[['FLT', 'DEP', 'ARR', 'STD', 'STD_TS', 'DATE_OBJ', 'CANC', 'LEG']].itertuples(index=False, name=None))
+                             for stn, grp in self.departures.groupby('DEP', sort=False, observed=True)}
+
+    @staticmethod
+    def group_inbound(arr):
+        # (FLT, DEP, ARR, STA, due time, DATE_OBJ, CANC, ETA, ATD, LEG) per ARR; due is the live ETA when there is one, else STA
+        return {stn: list(grp[['FLT', 'DEP', 'ARR', 'STA', 'DUE_TS', 'DATE_OBJ', 'CANC', 'ETA', 'ATD', 'LEG']].itertuples(index=False, name=None))
+                for stn, grp in arr.groupby('ARR', sort=False, observed=True)}
+
+    def flights_by_arrival(self):
+        # {(ARR, date): [FLT, ...]}; flight numbers repeat daily, so the date travels with every status request
+        if self.arrivals is None: return {}
+        return {(stn, day): list(grp) for (stn, day), grp in self.arrivals.groupby(['ARR', 'DATE_OBJ'], sort=False, observed=True)['FLT']}
+
+    def with_status(self, status, version):
+        # Live ETA/ATD joined onto the inbound legs in one merge on flight and date; built once per poller version. An ETA is
+        # only a clock time, so it is placed on whichever day puts it nearest the leg's STA (00:10 for a 23:50 STA is next day).
+        if self.arrivals is None or status.empty: return self.inbound
+        def build():
+            arr = self.arrivals.merge(status[['FLT', 'DATE_OBJ', 'ETA', 'ATD', 'ETA_MIN']], on=['FLT', 'DATE_OBJ'], how='left', sort=False)
+            late = (arr['ETA_MIN'] * 60 - arr['STA_TS'] % 86400 + 43200) % 86400 - 43200
+            arr = arr.assign(DUE_TS=(arr['STA_TS'] + late).fillna(arr['STA_TS']), ETA=arr['ETA'].fillna(""), ATD=arr['ATD'].fillna(""))
+            return self.group_inbound(arr)
+        return memory.get_or_build("inbound_status", (self.owner, version), build)
+
+    def station_fleet(self, iata, info):
+        return self.fleet.get(iata) or airport_fleet(info)
+
+
+# 2. MASTER DATABASE
+# Airports and runways come from OurAirports-format CSVs (point AIRPORTS_CSV/RUNWAYS_CSV at the full export to load the world);
+# the stations we operate, their fleet and special-airport status live in data/network.csv
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+AIRPORTS_CSV = os.environ.get("AIRPORTS_CSV", os.path.join(DATA_DIR, "airports.csv"))
+RUNWAYS_CSV = os.environ.get("RUNWAYS_CSV", os.path.join(DATA_DIR, "runways.csv"))
+NETWORK_CSV = os.path.join(DATA_DIR, "network.csv")
+AIRPORT_CACHE_DIR = ".airport_cache"  # Compiled .npy columns, memory-mapped read-only on load
+GRID_DEG = 1.0                        # Spatial index cell size in degrees
+
+class AirportDB:
+    # Columnar airport table: one row per airport (sorted by ident), runways flattened with per-airport offsets,
+    # and a lat/lon grid sorted by cell so viewport/radius queries are a couple of binary searches per grid row
+    COLUMNS = ("ident", "iata", "lat", "lon", "rwy_start", "rwy_name", "rwy_hdg", "cell_order", "cell_sorted")
+
+    def __init__(self, cols):
+        for name in self.COLUMNS: setattr(self, name, cols[name])
+
+    @staticmethod
+    def grid_cell(lat, lon):
+        n_lon = int(360 / GRID_DEG)
+        return (np.floor((np.asarray(lat) + 90) / GRID_DEG).astype(np.int64) * n_lon + np.floor((np.asarray(lon) + 180) / GRID_DEG).astype(np.int64) % n_lon)
+
+    @classmethod
+    def compile(cls, airports_csv, runways_csv):
+        ap = pd.read_csv(airports_csv, usecols=['ident', 'type', 'latitude_deg', 'longitude_deg', 'iata_code'], dtype={'ident': str, 'type': str, 'iata_code': str}, keep_default_na=False)
+        ap = ap[~ap['type'].isin(['closed', 'heliport', 'balloonport'])].sort_values('ident').reset_index(drop=True)
+        rw = pd.read_csv(runways_csv, usecols=['airport_ident', 'length_ft', 'closed', 'le_ident', 'le_heading_degT', 'he_ident'], dtype={'airport_ident': str, 'le_ident': str, 'he_ident': str}, keep_default_na=False, na_values={'length_ft': [''], 'closed': [''], 'le_heading_degT': ['']})
+        # Only open, numbered runways: helipads (H1), glider strips (08G) and water lanes never carry a crosswind limit
+        rw = rw[(rw['closed'].fillna(0) == 0) & rw['le_ident'].str.fullmatch(r'\d{2}[LRC]?')]
+        rw = rw.assign(apt=rw['airport_ident'].map(pd.Series(ap.index, index=ap['ident'])), hdg=rw['le_heading_degT'].fillna(rw['le_ident'].str[:2].astype(float) * 10))
+        rw = rw.dropna(subset=['apt']).sort_values(['apt', 'length_ft'], ascending=[True, False], kind='stable')
+        lat, lon = ap['latitude_deg'].to_numpy(np.float32), ap['longitude_deg'].to_numpy(np.float32)
+        cell = cls.grid_cell(lat, lon)
+        cell_order = np.argsort(cell, kind='stable')
+        return cls({"ident": ap['ident'].to_numpy(str), "iata": ap['iata_code'].to_numpy(str), "lat": lat, "lon": lon,
+                    "rwy_start": np.concatenate([[0], np.cumsum(np.bincount(rw['apt'].astype(int), minlength=len(ap)))]).astype(np.int32),
+                    "rwy_name": (rw['le_ident'] + "/" + rw['he_ident']).to_numpy(str), "rwy_hdg": rw['hdg'].to_numpy(np.float32),
+                    "cell_order": cell_order.astype(np.int32), "cell_sorted": cell[cell_order]})
+
+    @classmethod
+    def load(cls, airports_csv=AIRPORTS_CSV, runways_csv=RUNWAYS_CSV, cache_dir=AIRPORT_CACHE_DIR):
+        # The compiled columns are keyed by the source files' size and mtime, so a new export recompiles once
+        key = hashlib.sha1(repr([(os.path.abspath(f), os.path.getsize(f), os.path.getmtime(f)) for f in (airports_csv, runways_csv)]).encode()).hexdigest()[:16]
+        out_dir = os.path.join(cache_dir, key)
+        try: return cls({name: np.load(os.path.join(out_dir, f"{name}.npy"), mmap_mode='r') for name in cls.COLUMNS})
+        except (OSError, ValueError): pass
+        db = cls.compile(airports_csv, runways_csv)
+        try:
+            os.makedirs(out_dir + ".tmp", exist_ok=True)
+            for name in cls.COLUMNS: np.save(os.path.join(out_dir + ".tmp", f"{name}.npy"), getattr(db, name))
+            os.replace(out_dir + ".tmp", out_dir)
+        except OSError: pass
+        return db
+
+    def find(self, ident):
+        row = int(np.searchsorted(self.ident, ident))
+        return row if row < len(self.ident) and self.ident[row] == ident else None
+
+    def runways(self, row):
+        lo, hi = self.rwy_start[row], self.rwy_start[row + 1]
+        return tuple((str(name), float(hdg)) for name, hdg in zip(self.rwy_name[lo:hi], self.rwy_hdg[lo:hi]))
+
+    def in_viewport(self, south, west, north, east):
+        # Rows of every airport inside the box; a box crossing the antimeridian has west > east
+        n_lon = int(360 / GRID_DEG)
+        rows = []
+        lon_spans = [(west, east)] if west <= east else [(west, 180), (-180, east)]
+        for lat_row in range(int((max(south, -90) + 90) // GRID_DEG), int((min(north, 89.999) + 90) // GRID_DEG) + 1):
+            for w, e in lon_spans:
+                lo = np.searchsorted(self.cell_sorted, lat_row * n_lon + int((w + 180) // GRID_DEG) % n_lon, 'left')
+                hi = np.searchsorted(self.cell_sorted, lat_row * n_lon + min(int((e + 180) // GRID_DEG), n_lon - 1), 'right')
+                rows.append(self.cell_order[lo:hi])
+        rows = np.unique(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int32)
+        lat, lon = self.lat[rows], self.lon[rows]
+        in_lon = (lon >= west) & (lon <= east) if west <= east else (lon >= west) | (lon <= east)
+        return rows[(lat >= south) & (lat <= north) & in_lon]
+
+    def within_radius(self, lat, lon, radius_nm):
+        # (rows, distances in NM) of airports within radius_nm, nearest first
+        # Exact lat/lon half-widths of the circle's bounding box (the great circle bulges poleward); a circle over a pole spans all longitudes
+        r_ang = radius_nm / 3440.065
+        dlat = math.degrees(r_ang)
+        cos_lat = math.cos(math.radians(lat))
+        dlon = 180.0 if abs(lat) + dlat >= 90 or math.sin(r_ang) >= cos_lat else math.degrees(math.asin(math.sin(r_ang) / cos_lat))
+        west, east = ((lon - dlon + 180) % 360) - 180, ((lon + dlon + 180) % 360) - 180
+        rows = self.in_viewport(lat - dlat, west if dlon < 180 else -180, lat + dlat, east if dlon < 180 else 180)
+        phi1, phi2 = math.radians(lat), np.radians(self.lat[rows].astype(float))
+        a = np.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(np.radians(self.lon[rows].astype(float) - lon) / 2) ** 2
+        dist = 2 * 3440.065 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+        keep = np.argsort(dist[dist <= radius_nm], kind='stable')
+        return rows[dist <= radius_nm][keep], dist[dist <= radius_nm][keep]
+
+def load_network(db, network_csv=NETWORK_CSV):
+    # Station dict used across the app: {IATA: {icao, lat, lon, rwy (longest runway heading), rwys ((designators, heading), ...), fleet, spec, alt_only}}
+    airports, missing = {}, []
+    for iata, icao, fleet, spec, alt_only in pd.read_csv(network_csv, dtype=str).itertuples(index=False):
+        row = db.find(icao)
+        rwys = db.runways(row) if row is not None else ()
+        if not rwys: missing.append(iata); continue
+        airports[iata] = {"icao": icao, "lat": float(db.lat[row]), "lon": float(db.lon[row]), "rwy": int(round(rwys[0][1])), "rwys": rwys,
+                          "fleet": fleet, "spec": spec == "1", "alt_only": alt_only == "1"}
+    return airports, missing
+
+PREFERRED_ALTERNATES = {"FLR": ["PSA", "BLQ"], "FNC": ["PXO"], "INN": ["MUC"]}
+ALT_CANDIDATES = 10       # Nearest stations kept per airport for the strategy brief
+PREFERRED_ALT_BONUS = 1000 # NM taken off a preferred alternate's score
+ALT_HAZARD_PENALTY = 250  # NM added to an alternate with a live crosswind or forecast hazard in the scan window
+
+class AlternatesIndex:
+    # Great-circle distances between every airport, computed once, plus each airport's k nearest neighbours
+    def __init__(self, airport_dict, preferred=PREFERRED_ALTERNATES, k=ALT_CANDIDATES):
+        self.iatas = list(airport_dict)
+        self.pos = {iata: n for n, iata in enumerate(self.iatas)}
+        lat = np.radians([info['lat'] for info in airport_dict.values()]).astype(np.float32)
+        lon = np.radians([info['lon'] for info in airport_dict.values()]).astype(np.float32)
+        a = np.sin((lat[None, :] - lat[:, None]) / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin((lon[None, :] - lon[:, None]) / 2) ** 2
+        self.dist = np.round(2 * 3440.065 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)), 1)
+        np.fill_diagonal(self.dist, np.inf)
+        k = min(k, len(self.iatas) - 1)
+        nearest = np.argpartition(self.dist, k - 1, axis=1)[:, :k] if k > 0 else np.empty((len(self.iatas), 0), dtype=int)
+        self.candidates = {iata: sorted(set(nearest[n].tolist()) | {self.pos[g] for g in preferred.get(iata, []) if g in self.pos})
+                           for n, iata in enumerate(self.iatas)}
+        self.preferred = {iata: {self.pos[g] for g in alts if g in self.pos} for iata, alts in preferred.items()}
+
+    def rank(self, iata, hazard_table, hazard_hits, xw_threshold, limit=3):
+        if iata not in self.pos: return []
+        n, alts = self.pos[iata], []
+        for c in self.candidates[iata]:
+            g = self.iatas[c]
+            h = hazard_table.pos.get(g)
+            xw = int(hazard_table.cur_xw[h]) if h is not None else 0
+            score = float(self.dist[n, c])
+            if c in self.preferred.get(iata, ()): score -= PREFERRED_ALT_BONUS
+            if xw >= xw_threshold or h in hazard_hits: score += ALT_HAZARD_PENALTY
+            alts.append({"iata": g, "dist": round(float(self.dist[n, c]), 1), "xw": xw, "score": score})
+        return sorted(alts, key=lambda x: x['score'])[:limit]
+
+
+
+# 3. WEATHER ENGINE
+# Point WX_API_URL at a local stand-in (e.g. http://127.0.0.1:8765/{}) to run without aviationweather.gov
+WX_API_URL = os.environ.get("WX_API_URL", "https://aviationweather.gov/api/data/{}")
+FETCH_WORKERS = 16     # Concurrent stations in flight
+FETCH_TIMEOUT = 8      # Seconds per METAR/TAF request
+FETCH_DEADLINE = 25    # Seconds for the whole network; stragglers are served as offline
+REFRESH_INTERVAL = 900 # Seconds between background weather cycles
+SNAPSHOT_FILE = "weather_snapshot.json"
+SNAPSHOT_SCHEMA = 1    # Bump when StationWx/TafPeriod fields change; older files are ignored on load
+wx_http = requests.Session()
+wx_http.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=FETCH_WORKERS))
+wx_http.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=FETCH_WORKERS))
+
+def num_or_none(obj, attr):
+    val = getattr(obj, attr, None) if obj else None
+    return get_safe_num(val.value, None) if val else None
+
+class TafPeriod:
+    # One TAF change group, reduced to what the hazard scan reads. Times are UTC epoch seconds.
+    __slots__ = ("start", "end", "raw", "vis", "w_dir", "w_spd", "w_gst")
+    def __init__(self, start, end, raw, vis=None, w_dir=None, w_spd=0, w_gst=0):
+        self.start, self.end, self.raw, self.vis, self.w_dir, self.w_spd, self.w_gst = start, end, raw, vis, w_dir, w_spd, w_gst
+
+    @classmethod
+    def from_line(cls, line):
+        start, end = getattr(line, 'start_time', None), getattr(line, 'end_time', None)
+        return cls(int(start.dt.timestamp()) if start else None, int(end.dt.timestamp()) if end else None, line.raw or "",
+                   num_or_none(line, 'visibility'), num_or_none(line, 'wind_direction'), num_or_none(line, 'wind_speed') or 0, num_or_none(line, 'wind_gust') or 0)
+
+    def to_list(self): return [self.start, self.end, self.raw, self.vis, self.w_dir, self.w_spd, self.w_gst]
+
+class StationWx:
+    # Compact, pickle-free stand-in for a station's avwx Metar/Taf pair
+    __slots__ = ("status", "raw_m", "raw_t", "vis", "cig", "w_dir", "w_spd", "w_gst", "periods", "latency", "error")
+    def __init__(self, status="offline", raw_m="N/A", raw_t="N/A", vis=9999, cig=9999, w_dir=0, w_spd=0, w_gst=0, periods=(), latency=None, error=None):
+        self.status, self.raw_m, self.raw_t, self.vis, self.cig = status, raw_m, raw_t, vis, cig
+        self.w_dir, self.w_spd, self.w_gst, self.periods, self.latency, self.error = w_dir, w_spd, w_gst, tuple(periods), latency, error
+
+    @classmethod
+    def from_reports(cls, m, t, latency=None):
+        cig = 9999
+        for lyr in (m.data.clouds or []):
+            if lyr.type in ['BKN', 'OVC'] and lyr.base: cig = min(cig, lyr.base * 100)
+        forecast = t.data.forecast if (t and t.data and t.data.forecast) else []
+        vis = num_or_none(m.data, 'visibility')
+        return cls("online", m.raw or "N/A", t.raw if t else "N/A", 9999 if vis is None else vis, cig,
+                   num_or_none(m.data, 'wind_direction') or 0, num_or_none(m.data, 'wind_speed') or 0, num_or_none(m.data, 'wind_gust') or 0,
+                   [TafPeriod.from_line(line) for line in forecast], latency)
+
+    def with_latency(self, latency):
+        return StationWx(self.status, self.raw_m, self.raw_t, self.vis, self.cig, self.w_dir, self.w_spd, self.w_gst, self.periods, latency)
+
+    def to_list(self):
+        return [self.status, self.raw_m, self.raw_t, self.vis, self.cig, self.w_dir, self.w_spd, self.w_gst, [p.to_list() for p in self.periods], self.latency, self.error]
+
+    @classmethod
+    def from_list(cls, row):
+        return cls(*row[:8], [TafPeriod(*p) for p in row[8]], *row[9:])
+
+class WeatherSnapshot:
+    # One fetch cycle for the whole network. Treated as immutable, so sharing it between sessions is a reference copy.
+    # `changed` holds the stations whose reports differ from the cycle before; None when unknown (loaded or replayed).
+    __slots__ = ("version", "fetched_at", "stations", "changed")
+    def __init__(self, version=0, fetched_at=None, stations=None, changed=None):
+        self.version, self.fetched_at, self.stations, self.changed = version, fetched_at, stations or {}, changed
+
+    def save(self, path=SNAPSHOT_FILE):
+        payload = {"schema": SNAPSHOT_SCHEMA, "version": self.version, "fetched_at": self.fetched_at.isoformat() if self.fetched_at else None,
+                   "stations": {iata: wx.to_list() for iata, wx in self.stations.items()}}
+        with open(path + ".tmp", "w") as f: json.dump(payload, f, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path=SNAPSHOT_FILE):
+        try:
+            with open(path) as f: payload = json.load(f)
+            if payload.get("schema") != SNAPSHOT_SCHEMA: return None
+            fetched_at = datetime.fromisoformat(payload['fetched_at']) if payload.get('fetched_at') else None
+            return cls(payload['version'], fetched_at, {iata: StationWx.from_list(row) for iata, row in payload['stations'].items()})
+        except (OSError, ValueError, KeyError, TypeError): return None
+
+def fetch_report_text(kind, icao, timeout=FETCH_TIMEOUT):
+    resp = wx_http.get(WX_API_URL.format(kind), params={"ids": icao}, timeout=timeout)
+    resp.raise_for_status()
+    return " ".join(resp.text.split())
+
+def fetch_station_reports(icao, timeout=FETCH_TIMEOUT, previous=None):
+    # Reports whose raw text matches the previous cycle reuse its parsed StationWx; only changed reports go through avwx
+    t0 = time.perf_counter()
+    try:
+        raw_m = fetch_report_text("metar", icao, timeout)
+        if not raw_m: raise ValueError(f"No METAR for {icao}")
+        raw_t = fetch_report_text("taf", icao, timeout)
+        metrics.lookup("report_parse")
+        if previous is not None and previous.status == "online" and (previous.raw_m, previous.raw_t) == (raw_m, raw_t or "N/A"):
+            return previous.with_latency(round(time.perf_counter() - t0, 3))
+        metrics.miss("report_parse")
+        from avwx import Metar, Taf
+        m = Metar.from_report(raw_m)
+        if not m or not m.data: raise ValueError(f"No METAR for {icao}")
+        t = Taf.from_report(raw_t) if raw_t else None
+        return StationWx.from_reports(m, t, round(time.perf_counter() - t0, 3))
+    except Exception as e:
+        return StationWx(latency=round(time.perf_counter() - t0, 3), error=type(e).__name__)
+
+def get_raw_weather_master(airport_dict, previous=None):
+    # avwx lazy-loads its station table on first parse with no lock; load it once here so the workers don't all race to do it
+    started = metrics.start()
+    previous = previous or {}
+    from avwx import Station  # Deferred: the CLI can start and work from a saved snapshot without loading avwx at all
+    try: Station.from_icao(next(iter(airport_dict.values()))['icao'])
+    except Exception: pass
+    pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="wx-fetch")
+    futures = {iata: pool.submit(fetch_station_reports, info['icao'], FETCH_TIMEOUT, previous.get(iata)) for iata, info in airport_dict.items()}
+    wait(futures.values(), timeout=FETCH_DEADLINE)
+    pool.shutdown(wait=False, cancel_futures=True)
+    
+    # Partial-result policy: anything still in flight at the deadline is served as offline, never waited on
+    raw_res = {}
+    for iata, fut in futures.items():
+        raw_res[iata] = fut.result() if fut.done() and not fut.cancelled() else StationWx(latency=FETCH_DEADLINE, error="deadline")
+    metrics.stop("fetch", started); metrics.record_fetch(raw_res)
+    return raw_res
+
+def changed_stations(before, after):
+    # Stations whose METAR/TAF text or online status differs between two bundles; the dirty set for everything downstream
+    return frozenset(iata for iata, wx in after.items() if (old := before.get(iata)) is None or (old.status, old.raw_m, old.raw_t) != (wx.status, wx.raw_m, wx.raw_t))
+
+HISTORY_DIR = ".wx_history"     # One Parquet file per fetch cycle under day=YYYY-MM-DD/ partitions
+HISTORY_RETENTION_DAYS = 14     # Older day partitions are dropped on append
+HISTORY_WINDOW_HOURS = 24       # Kept in memory for trend and handover queries
+TREND_LOOKBACK_MIN = 60         # Trend arrows compare the current METAR with the one this long ago
+HANDOVER_WINDOW_HOURS = 8
+
+def metar_issue_count(frame, xw_threshold, airport_dict):
+    # Vectorised count of the marker loop's METAR hazard categories, one per history row
+    spec = frame['iata'].map(lambda iata: airport_dict.get(iata, {}).get('spec', False)).to_numpy(dtype=bool)
+    tokens, xw, gst = frame['tokens'].to_numpy(), frame['xw'].to_numpy(), frame['w_gst'].to_numpy()
+    is_xw = xw >= xw_threshold
+    tailwind = (frame['iata'].to_numpy() == "FLR") & (np.abs(np.maximum(frame['w_spd'].to_numpy(), gst) * np.cos(np.radians(frame['w_dir'].to_numpy() - 50))) >= 10)
+    return ((tokens & TK_FOG > 0).astype(int) + (tokens & TK_WINTER > 0) + (tokens & TK_TSRA > 0)
+            + (frame['vis'].to_numpy() < np.where(spec, 1500, 800)) + (frame['cig'].to_numpy() < np.where(spec, 500, 200))
+            + is_xw + ((gst > 25) & ~is_xw) + tailwind)
+
+class WeatherHistory:
+    # Append-only cycle log: compact observation columns for trend queries plus each StationWx row for offline replay
+    def __init__(self, airport_dict, root=HISTORY_DIR):
+        self.airport_dict, self.root, self.lock = airport_dict, root, threading.Lock()
+        now = datetime.now(timezone.utc)
+        recent = self.read((now - timedelta(hours=HISTORY_WINDOW_HOURS)).date(), now.date())
+        self.recent = recent[recent['fetched_at'] >= now - timedelta(hours=HISTORY_WINDOW_HOURS)] if not recent.empty else recent
+
+    def partition(self, day): return os.path.join(self.root, f"day={day.isoformat()}")
+
+    def days(self):
+        try: return sorted((datetime.strptime(d[4:], "%Y-%m-%d").date() for d in os.listdir(self.root) if d.startswith("day=")), reverse=True)
+        except OSError: return []
+
+    def frame(self, snapshot):
+        iatas = [iata for iata, wx in snapshot.stations.items() if iata in self.airport_dict]
+        wxs = [snapshot.stations[iata] for iata in iatas]
+        xw = best_xwind(np.array([wx.w_dir for wx in wxs], dtype=float), np.array([max(wx.w_spd, wx.w_gst) for wx in wxs], dtype=float),
+                        runway_headings([self.airport_dict[iata] for iata in iatas]))
+        return pd.DataFrame({
+            "fetched_at": pd.Series([snapshot.fetched_at] * len(iatas), dtype="datetime64[us, UTC]"), "version": np.int32(snapshot.version),
+            "iata": pd.Categorical(iatas), "online": np.array([wx.status == "online" for wx in wxs], dtype=bool),
+            "vis": np.array([wx.vis for wx in wxs], dtype=np.float32), "cig": np.array([wx.cig for wx in wxs], dtype=np.float32),
+            "w_dir": np.array([wx.w_dir for wx in wxs], dtype=np.float32), "w_spd": np.array([wx.w_spd for wx in wxs], dtype=np.float32),
+            "w_gst": np.array([wx.w_gst for wx in wxs], dtype=np.float32), "xw": xw.astype(np.float32),
+            "tokens": np.array([scan_hazards(wx.raw_m)[0] for wx in wxs], dtype=np.int16),
+            "wx": [json.dumps(wx.to_list(), separators=(",", ":")) for wx in wxs]})
+
+    def append(self, snapshot):
+        if not snapshot.stations or snapshot.fetched_at is None: return
+        df = self.frame(snapshot)
+        part = self.partition(snapshot.fetched_at.date())
+        path = os.path.join(part, f"cycle-{snapshot.fetched_at:%H%M%S}-v{snapshot.version}.parquet")
+        os.makedirs(part, exist_ok=True)
+        df.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=HISTORY_WINDOW_HOURS)
+        with self.lock:
+            recent = self.recent[self.recent['fetched_at'] >= cutoff] if not self.recent.empty else self.recent
+            self.recent = pd.concat([recent, df[df['fetched_at'] >= cutoff]], ignore_index=True) if not recent.empty else df[df['fetched_at'] >= cutoff]
+        self.prune(snapshot.fetched_at.date())
+
+    def prune(self, today):
+        for day in self.days():
+            if (today - day).days > HISTORY_RETENTION_DAYS: shutil.rmtree(self.partition(day), ignore_errors=True)
+
+    def read(self, first_day, last_day):
+        frames = []
+        for n in range((last_day - first_day).days + 1):
+            day = first_day + timedelta(days=n)
+            try: files = sorted(f for f in os.listdir(self.partition(day)) if f.endswith(".parquet"))
+            except OSError: continue
+            # Past days are immutable once the clock has moved on, so their frames are read once (while the memory budget keeps them)
+            cached = memory.get("history_day", (self.root, day))
+            if cached and cached[0] == len(files): frames.append(cached[1]); continue
+            try: df = pd.concat([pd.read_parquet(os.path.join(self.partition(day), f)) for f in files], ignore_index=True) if files else None
+            except Exception: df = None
+            if df is None: continue
+            memory.put("history_day", (self.root, day), (len(files), df))
+            frames.append(df)
+        if not frames: return pd.DataFrame()
+        df = pd.concat(frames, ignore_index=True)
+        df['iata'] = df['iata'].astype(str)
+        return df.sort_values('fetched_at', kind='stable', ignore_index=True)
+
+    def window(self, now=None):
+        # History up to `now`: the in-memory window when live, the stored partitions when replaying
+        if now is None:
+            with self.lock: return self.recent
+        df = self.read((now - timedelta(hours=HISTORY_WINDOW_HOURS)).date(), now.date())
+        return df[(df['fetched_at'] <= now) & (df['fetched_at'] > now - timedelta(hours=HISTORY_WINDOW_HOURS))] if not df.empty else df
+
+    def cycles(self, day):
+        df = self.read(day, day)
+        return [] if df.empty else list(df['fetched_at'].drop_duplicates())
+
+    def snapshot_at(self, fetched_at):
+        df = self.read(fetched_at.date(), fetched_at.date())
+        rows = df[df['fetched_at'] == fetched_at] if not df.empty else df
+        if rows.empty: return None
+        # Replayed snapshots get their own version space so they never collide with live cache keys
+        return WeatherSnapshot(-int(fetched_at.timestamp()), fetched_at.to_pydatetime(), {iata: StationWx.from_list(json.loads(wx)) for iata, wx in zip(rows['iata'], rows['wx'])})
+
+    def trends(self, frame, xw_threshold, now):
+        # {iata: (issue count TREND_LOOKBACK_MIN ago or None, start of the current hazardous run or None)}
+        if frame.empty: return {}
+        f = frame[frame['online']].assign(score=lambda d: metar_issue_count(d, xw_threshold, self.airport_dict)).sort_values(['iata', 'fetched_at'], kind='stable')
+        then = f[f['fetched_at'] <= now - timedelta(minutes=TREND_LOOKBACK_MIN)].groupby('iata', observed=True)['score'].last()
+        last_clean = f[f['score'] == 0].groupby('iata', observed=True)['fetched_at'].max()
+        after_clean = f['fetched_at'] > f['iata'].map(last_clean).fillna(pd.Timestamp.min.tz_localize("UTC"))
+        since = f[(f['score'] > 0) & after_clean].groupby('iata', observed=True)['fetched_at'].min()
+        return {iata: (int(then[iata]) if iata in then.index else None, since.get(iata)) for iata in f['iata'].unique()}
+
+    def events(self, frame, xw_threshold, start):
+        # (time, iata, DETERIORATED/IMPROVED) whenever a station crossed between clean and hazardous since `start`
+        if frame.empty: return []
+        f = frame[frame['online']].assign(score=lambda d: metar_issue_count(d, xw_threshold, self.airport_dict)).sort_values(['iata', 'fetched_at'], kind='stable')
+        prev = f.groupby('iata', observed=True)['score'].shift()
+        flips = f[prev.notna() & ((prev > 0) != (f['score'] > 0)) & (f['fetched_at'] >= start)]
+        return sorted((t, iata, "DETERIORATED" if s > 0 else "IMPROVED") for t, iata, s in zip(flips['fetched_at'], flips['iata'], flips['score']))
+
+class WeatherRefresher:
+    # Stale-while-revalidate: renders always read the last good snapshot, the worker thread swaps in the next one
+    def __init__(self, airport_dict, interval=REFRESH_INTERVAL, snapshot_file=SNAPSHOT_FILE):
+        self.airport_dict, self.interval, self.snapshot_file = airport_dict, interval, snapshot_file
+        self.history = WeatherHistory(airport_dict)
+        self.ready, self.wake = threading.Event(), threading.Event()
+        # Cold start renders straight from the last persisted cycle while the first live fetch runs
+        self.current = WeatherSnapshot.load(snapshot_file) or WeatherSnapshot()
+        if self.current.stations: self.ready.set()
+        self.thread = threading.Thread(target=self._run, name="wx-refresher", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                bundle = get_raw_weather_master(self.airport_dict, self.current.stations)
+                # Keep serving the last good snapshot if the whole network came back offline (outage / no connectivity)
+                if any(wx.status == "online" for wx in bundle.values()) or not self.current.stations:
+                    self.current = WeatherSnapshot(self.current.version + 1, datetime.now(timezone.utc), bundle, changed_stations(self.current.stations, bundle))
+                    self.current.save(self.snapshot_file)
+                    metrics.size("weather_snapshot", os.path.getsize(self.snapshot_file))
+                    self.history.append(self.current)
+            except Exception: pass
+            metrics.memory_usage(memory.usage())
+            metrics.flush()
+            self.ready.set()
+            self.wake.wait(self.interval); self.wake.clear()
+
+    def snapshot(self):
+        # Only the very first render of a process with no saved snapshot waits, as there is nothing to serve yet
+        if not self.ready.is_set(): self.ready.wait(FETCH_DEADLINE + FETCH_TIMEOUT)
+        return self.current
+
+    def age_minutes(self):
+        fetched_at = self.current.fetched_at
+        return None if fetched_at is None else int((datetime.now(timezone.utc) - fetched_at).total_seconds() // 60)
+
+    def refresh_now(self): self.wake.set()
+
+# Hazard bitflags for TAF periods, in the order they are reported
+HZ_WINTER_FOG, HZ_VIS, HZ_XWIND, HZ_WINDY, HZ_TAILWIND = 1, 2, 4, 8, 16
+HZ_AT_RISK = HZ_WINTER_FOG | HZ_VIS | HZ_XWIND | HZ_TAILWIND   # Anything else (gusts) is a caution
+SEG_STRIDE = 1e10   # Station stride in the TAF segment keys; larger than any epoch second
+HZ_LABELS = ((HZ_WINTER_FOG, "WINTER/FOG"), (HZ_VIS, "VIS"), (HZ_XWIND, "XWIND"), (HZ_WINDY, "WINDY"), (HZ_TAILWIND, "TAILWIND(>10kt)"))
+
+class HazardTable:
+    # Every station's TAF periods flattened into NumPy columns once per snapshot, so any (horizon, xw limit) is a few array ops
+    def __init__(self, bundle, airport_dict):
+        self.bundle, self.iatas = bundle, [iata for iata in bundle if iata in airport_dict]
+        self.pos = {iata: n for n, iata in enumerate(self.iatas)}
+        stn_wx = [bundle[iata] for iata in self.iatas]
+        stn_hdg = runway_headings([airport_dict[iata] for iata in self.iatas])
+        self.cur_xw = best_xwind(np.array([wx.w_dir for wx in stn_wx], dtype=float), np.array([max(wx.w_spd, wx.w_gst) for wx in stn_wx], dtype=float), stn_hdg)
+        rows = [(n, p, airport_dict[iata]) for n, iata in enumerate(self.iatas) for p in bundle[iata].periods]
+        w_dir = np.array([info['rwy'] if p.w_dir is None else p.w_dir for _, p, info in rows], dtype=float)
+        vis = np.array([np.nan if p.vis is None else p.vis for _, p, _ in rows], dtype=float)
+        v_lim = np.array([1500 if info['spec'] else 800 for _, _, info in rows], dtype=float)
+        is_flr = np.array([self.iatas[n] == "FLR" for n, _, _ in rows], dtype=bool)
+        
+        self.stn = np.array([n for n, _, _ in rows], dtype=np.int32)
+        self.start = np.array([np.nan if p.start is None else p.start for _, p, _ in rows], dtype=float)
+        self.spd = np.array([max(p.w_spd, p.w_gst) for _, p, _ in rows], dtype=float)
+        self.xw = best_xwind(w_dir, self.spd, stn_hdg[self.stn])
+        # Flags that do not depend on the operator's settings are folded in once
+        self.static = (np.array([bool(scan_hazards(p.raw)[0] & (TK_FOG | TK_WINTER)) for _, p, _ in rows], dtype=bool) * HZ_WINTER_FOG
+                       | (vis < v_lim) * HZ_VIS
+                       | (is_flr & (np.abs(self.spd * np.cos(np.radians(w_dir - 50))) >= 10)) * HZ_TAILWIND).astype(np.int16)
+        self.owner = memory.owner()   # evaluate() results and leg flags are memory budget entries under this id
+        self.build_segments(np.array([np.nan if p.end is None else p.end for _, p, _ in rows], dtype=float))
+
+    def build_segments(self, end):
+        # Interval index over TAF change groups: each station's timeline is cut at every period start/end, and each elementary
+        # segment keeps the OR of the periods covering it. Keys are station * SEG_STRIDE + segment start, sorted for searchsorted.
+        keys, seg_end, static, max_xw, windy_xw = [], [], [], [], []
+        for n in np.unique(self.stn):
+            sel = np.flatnonzero((self.stn == n) & ~np.isnan(self.start) & ~np.isnan(end))
+            if not len(sel): continue
+            s, e = self.start[sel], end[sel]
+            bounds = np.unique(np.concatenate([s, e]))
+            b0, b1 = bounds[:-1], bounds[1:]
+            cover = (s[None, :] <= b0[:, None]) & (b0[:, None] < e[None, :])
+            live = cover.any(axis=1)
+            keys.append(n * SEG_STRIDE + b0[live]); seg_end.append(b1[live])
+            static.append(np.bitwise_or.reduce(np.where(cover, self.static[sel], 0), axis=1)[live])
+            max_xw.append(np.where(cover, self.xw[sel], -np.inf).max(axis=1)[live])
+            windy_xw.append(np.where(cover & (self.spd[sel] > 25), self.xw[sel], np.inf).min(axis=1)[live])
+        cat = lambda parts, dtype: np.concatenate(parts).astype(dtype) if parts else np.empty(0, dtype=dtype)
+        self.seg_key, self.seg_end, self.seg_static = cat(keys, float), cat(seg_end, float), cat(static, np.int16)
+        self.seg_max_xw, self.seg_windy_xw = cat(max_xw, float), cat(windy_xw, float)
+
+    def leg_flags(self, legs, stn_col, ts_col, xw_threshold, key):
+        # flight_flags over a schedule frame, built once per frame and threshold while the memory budget keeps it. `key` is the
+        # owner of the ScheduleIndex holding the frame: the flags are indexed by its LEG order, which a rebuilt index may not share
+        return memory.get_or_build("leg_flags", (self.owner, key, stn_col, xw_threshold), lambda: self.flight_flags(legs[stn_col], legs[ts_col], xw_threshold))
+
+    def flight_flags(self, stations, times, xw_threshold):
+        # Forecast hazard bits valid at each (station, epoch second) pair in one batched searchsorted; 0 where no TAF covers it
+        stn = stations.map(self.pos).to_numpy(dtype=float, na_value=np.nan)
+        t = np.asarray(times, dtype=float)
+        if not len(self.seg_key): return np.zeros(len(t), dtype=np.int16)
+        ok = ~np.isnan(stn) & ~np.isnan(t)
+        idx = np.searchsorted(self.seg_key, np.where(ok, stn * SEG_STRIDE + t, -1), side='right') - 1
+        at = np.clip(idx, 0, None)
+        hit = ok & (idx >= 0) & (self.seg_key[at] // SEG_STRIDE == stn) & (t < self.seg_end[at])
+        flags = self.seg_static[at] | np.where(self.seg_max_xw[at] >= xw_threshold, HZ_XWIND, 0) | np.where(self.seg_windy_xw[at] < xw_threshold, HZ_WINDY, 0)
+        return np.where(hit, flags, 0).astype(np.int16)
+
+    def evaluate(self, horizon_limit, xw_threshold, now=None):
+        # Returns {station index: (hazard bits, period start)} for the first hazardous period inside the horizon
+        cutoff_time = ((now or datetime.now(timezone.utc)) + timedelta(hours=horizon_limit)).timestamp()
+        def build():
+            flags = self.static | np.where(self.xw >= xw_threshold, HZ_XWIND, np.where(self.spd > 25, HZ_WINDY, 0))
+            hits = np.flatnonzero((flags != 0) & (self.start <= cutoff_time))
+            stns, first = np.unique(self.stn[hits], return_index=True)
+            return {int(n): (int(flags[hits[i]]), self.start[hits[i]]) for n, i in zip(stns, first)}
+        return memory.get_or_build("hazard_eval", (self.owner, horizon_limit, xw_threshold, int(cutoff_time // 60)), build)
+
+def process_weather_for_horizon(table, horizon_limit, xw_threshold, now=None):
+    processed = {}
+    hits = table.evaluate(horizon_limit, xw_threshold, now)
+    for n, iata in enumerate(table.iatas):
+        wx = table.bundle[iata]
+        if wx.status == "offline":
+            processed[iata] = {"status": "offline", "raw_m": "N/A", "raw_t": "N/A", "f_issues": [], "f_wind_spd":0, "f_wind_dir":0, "w_spd":0, "w_dir":0, "f_time": ""}
+            continue
+        bits, start = hits.get(n, (0, None))
+        f_issues = [label for bit, label in HZ_LABELS if bits & bit]
+        f_time = f"{datetime.fromtimestamp(start, timezone.utc).strftime('%H')}Z" if bits else ""
+        processed[iata] = {"vis": wx.vis, "cig": wx.cig, "status": "online", "w_dir": wx.w_dir, "w_spd": wx.w_spd, "w_gst": wx.w_gst, "raw_m": wx.raw_m, "raw_t": wx.raw_t, "f_issues": f_issues, "f_time": f_time}
+    return processed
+
+# Live flight status (Aviationstack flights endpoint, as probed in test_app.py). Off unless AVIATIONSTACK_KEY is set or
+# FLIGHT_API_URL points at a stand-in; the poller runs on its own thread and renders only ever read its last results
+FLIGHT_API_URL = os.environ.get("FLIGHT_API_URL", "http://api.aviationstack.com/v1/flights")
+FLIGHT_API_KEY = os.environ.get("AVIATIONSTACK_KEY", "")
+FLIGHT_STATUS_ENABLED = bool(FLIGHT_API_KEY) or "FLIGHT_API_URL" in os.environ
+FLIGHT_POLL_INTERVAL = 300   # Shortest gap between polls of one job; stretched so a month of polling fits FLIGHT_MONTHLY_QUOTA
+FLIGHT_MONTHLY_QUOTA = int(os.environ.get("FLIGHT_MONTHLY_QUOTA", "10000"))  # API calls per calendar month on the plan
+FLIGHT_PAGE_LIMIT = 100      # Results per request (the API's default page)
+FLIGHT_STATUS_TTL = 900      # Seconds a flight's last known status is served for, at least two poll intervals
+FLIGHT_MIN_SPACING = 1.0     # Seconds between any two API requests (free-tier rate limit)
+FLIGHT_BACKOFF_MAX = 3600    # Ceiling for the per-job error backoff
+FLIGHT_TRACK_TTL = 2 * REFRESH_INTERVAL  # Seconds a flight stays polled after the last render tracking it (live pages rerun at least every REFRESH_INTERVAL)
+FLIGHT_WORKERS = 4
+MONTH_SECONDS = 30 * 86400
+
+def iso_hhmm(stamp):
+    try: return datetime.fromisoformat(stamp).astimezone(timezone.utc).strftime("%H:%M") if stamp else None
+    except (TypeError, ValueError): return None
+
+class FlightStatusPoller:
+    # One job per arrival station, date and airline: the API is asked for that airline's arrivals only and paged until its
+    # pagination total is covered (or every tracked flight has been seen), so a BA leg at a busy hub is never lost behind
+    # other carriers' first page. ETags per page, Retry-After and doubling backoff per job. Every call counts against the
+    # monthly quota, which sets the poll interval. Statuses are keyed (FLT, date), so a number flown daily never lends
+    # today's ETA to tomorrow's leg.
+    def __init__(self, url=FLIGHT_API_URL, key=FLIGHT_API_KEY):
+        self.url, self.key = url, key
+        self.http = requests.Session()
+        self.http.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=FLIGHT_WORKERS))
+        self.http.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=FLIGHT_WORKERS))
+        self.lock, self.wake = threading.Lock(), threading.Event()
+        self.wanted, self.status, self.next_poll, self.failures = {}, {}, {}, {}   # wanted: job -> {FLT: last tracked}
+        self.etags, self.pages = {}, {}   # (job, offset) -> (ETag, status keys on that page, total); job -> calls its last poll took
+        self.next_slot, self.version, self.frame_memo, self.calls, self.month = 0.0, 0, (None, None), 0, None
+        self.thread = threading.Thread(target=self._run, name="flight-status", daemon=True)
+        self.thread.start()
+
+    def track(self, inbound):
+        # Called by renders with {(ARR, date): [FLT, ...]}. Each flight keeps the time it was last tracked and the union is
+        # polled, so one screen on tomorrow never stops the polling for every screen on today; a flight new to the union
+        # wakes the poller, a known one only has its time renewed
+        now, new = time.time(), False
+        with self.lock:
+            for (arr, day), flts in inbound.items():
+                for flt in flts:
+                    tracked = self.wanted.setdefault((arr, day, flt[:2]), {})
+                    new |= flt not in tracked
+                    tracked[flt] = now
+        if new: self.wake.set()
+
+    def _expire(self, now):
+        # Flights no render has tracked within FLIGHT_TRACK_TTL are dropped; a job left with none loses its ETags and schedule
+        with self.lock:
+            for job, tracked in list(self.wanted.items()):
+                live = {flt: seen for flt, seen in tracked.items() if now - seen <= FLIGHT_TRACK_TTL}
+                if live: self.wanted[job] = live; continue
+                del self.wanted[job]
+                for state in (self.next_poll, self.failures, self.pages): state.pop(job, None)
+                for page in [page for page in self.etags if page[0] == job]: del self.etags[page]
+
+    def poll_interval(self):
+        # Seconds between polls of each job: every round costs the calls the jobs' last polls took, and a month of rounds
+        # has to fit the quota
+        with self.lock: calls = sum(self.pages.get(job, 1) for job in self.wanted)
+        return max(FLIGHT_POLL_INTERVAL, MONTH_SECONDS * calls / max(FLIGHT_MONTHLY_QUOTA, 1))
+
+    def _throttle(self):
+        with self.lock:
+            slot = max(time.monotonic(), self.next_slot)
+            self.next_slot = slot + FLIGHT_MIN_SPACING
+        time.sleep(max(0.0, slot - time.monotonic()))
+
+    def _get(self, params, etag):
+        # One metered API call; None once this month's quota is spent
+        self._throttle()
+        with self.lock:
+            month = datetime.now(timezone.utc).strftime("%Y-%m")
+            if month != self.month: self.month, self.calls = month, 0
+            if self.calls >= FLIGHT_MONTHLY_QUOTA: return None
+            self.calls += 1
+        return self.http.get(self.url, params=params, headers={"If-None-Match": etag} if etag else {}, timeout=FETCH_TIMEOUT)
+
+    def _backoff(self, job, retry_after=None):
+        self.failures[job] = self.failures.get(job, 0) + 1
+        delay = get_safe_num(retry_after, None) or min(FLIGHT_POLL_INTERVAL * 2 ** self.failures[job], FLIGHT_BACKOFF_MAX)
+        self.next_poll[job] = time.time() + delay
+
+    def poll_station(self, job, flts):
+        arr, day, airline = job
+        wanted, seen, offset, calls = {(flt, day) for flt in flts}, set(), 0, 0
+        while True:
+            params = {"arr_iata": arr, "airline_iata": airline, "flight_date": day.isoformat(), "limit": FLIGHT_PAGE_LIMIT, "offset": offset,
+                      **({"access_key": self.key} if self.key else {})}
+            cached = self.etags.get((job, offset))
+            try: resp = self._get(params, cached[0] if cached else None)
+            except requests.RequestException: return self._backoff(job)
+            if resp is None:   # Quota spent: what is already known is served until the next poll
+                self.next_poll[job] = time.time() + FLIGHT_BACKOFF_MAX
+                return
+            calls += 1
+            now = time.time()
+            if resp.status_code == 304 and cached:
+                _, on_page, total = cached
+                with self.lock: self.status.update({key: (*self.status[key][:3], now) for key in on_page if key in self.status})
+            elif resp.status_code == 429 or resp.status_code >= 500: return self._backoff(job, resp.headers.get("Retry-After"))
+            elif not resp.ok: return self._backoff(job)
+            else:
+                try:
+                    body = resp.json()
+                    data, total = body.get('data') or [], int((body.get('pagination') or {}).get('total') or 0)
+                except (ValueError, TypeError, AttributeError): return self._backoff(job)
+                found = {}
+                for item in data:
+                    key = ((item.get('flight') or {}).get('iata'), day)
+                    if key in wanted and item.get('flight_date', day.isoformat()) == day.isoformat():
+                        found[key] = (iso_hhmm((item.get('arrival') or {}).get('estimated')), iso_hhmm((item.get('departure') or {}).get('actual')), item.get('flight_status'), now)
+                on_page = frozenset(found)
+                if resp.headers.get("ETag"): self.etags[(job, offset)] = (resp.headers["ETag"], on_page, total)
+                with self.lock: self.status.update(found)
+            seen |= on_page
+            offset += FLIGHT_PAGE_LIMIT
+            if offset >= total or wanted <= seen: break
+        self.pages[job], self.failures[job] = calls, 0
+        self.next_poll[job] = time.time() + self.poll_interval()
+
+    def _run(self):
+        pool = ThreadPoolExecutor(max_workers=FLIGHT_WORKERS, thread_name_prefix="flight-poll")
+        while True:
+            self._expire(time.time())
+            with self.lock: wanted = {job: frozenset(tracked) for job, tracked in self.wanted.items()}
+            due = [(job, flts) for job, flts in wanted.items() if self.next_poll.get(job, 0) <= time.time()]
+            if due:
+                list(pool.map(lambda job: self.poll_station(*job), due))
+                with self.lock: self.version += 1
+            upcoming = [self.next_poll.get(job, 0) for job in wanted]
+            self.wake.wait(min(max(min(upcoming, default=FLIGHT_POLL_INTERVAL + time.time()) - time.time(), 1), FLIGHT_POLL_INTERVAL))
+            self.wake.clear()
+
+    def frame(self):
+        # FLT/DATE_OBJ/ETA/ATD/ETA_MIN for statuses seen within the TTL (never shorter than two poll intervals); rebuilt once per poll cycle
+        ttl = max(FLIGHT_STATUS_TTL, 2 * self.poll_interval())
+        with self.lock:
+            version = self.version
+            if self.frame_memo[0] == version: return version, self.frame_memo[1]
+            # Expired statuses are dropped here too, so a poller running for weeks holds only the flights it still serves
+            self.status = {key: st for key, st in self.status.items() if time.time() - st[3] <= ttl}
+            fresh = [(flt, day, eta, atd) for (flt, day), (eta, atd, _, _) in self.status.items()]
+        df = pd.DataFrame(fresh, columns=['FLT', 'DATE_OBJ', 'ETA', 'ATD'])
+        eta = pd.to_datetime(df['ETA'], format="%H:%M", errors='coerce')
+        df['ETA_MIN'] = eta.dt.hour * 60 + eta.dt.minute
+        self.frame_memo = (version, df)
+        return version, df
+
+# 4. STATION ASSESSMENT, ALERTS & HANDOVER
+RED, AMBER, GREEN = "#d6001a", "#eb8f34", "#008000"
+
+def assess_station(iata, info, data, xw_threshold, issues_then=None, hazard_since=None):
+    # Live METAR issues, colour, trend arrow and alert entries for one station, as the map marker and the CLI both report it
+    v_lim, c_lim = (1500, 500) if info['spec'] else (800, 200)
+    m_issues = []
+    
+    cur_w_dir = get_safe_num(data.get('w_dir', 0))
+    cur_w_spd = get_safe_num(data.get('w_spd', 0))
+    cur_w_gst = get_safe_num(data.get('w_gst', 0))
+    rwy_name, cur_xw = best_runway(cur_w_dir, max(cur_w_spd, cur_w_gst), info['rwys'])
+    m_tokens = scan_hazards(data['raw_m'])[0]
+    
+    if m_tokens & TK_FOG: m_issues.append("FOG")
+    if m_tokens & TK_WINTER: m_issues.append("WINTER")
+    if data.get('vis', 9999) < v_lim: m_issues.append("VIS")
+    if data.get("cig", 9999) < c_lim: m_issues.append("CLOUD")
+    if m_tokens & TK_TSRA: m_issues.append("TSRA")
+    if cur_xw >= xw_threshold: m_issues.append("XWIND")
+    if cur_w_gst > 25 and "XWIND" not in m_issues: m_issues.append("WINDY")
+    
+    if iata == "FLR":
+        tw_comp = abs(max(cur_w_spd, cur_w_gst) * math.cos(math.radians(cur_w_dir - 50)))
+        if tw_comp >= 10: m_issues.append("TAILWIND(>10kt)")
+    
+    # With an hour of history the arrow compares against the METAR then; before that it falls back to METAR vs TAF
+    trend_icon = "➡️"
+    if issues_then is not None:
+        if len(m_issues) > issues_then: trend_icon = "📈"
+        elif len(m_issues) < issues_then: trend_icon = "📉"
+    elif not m_issues and data['f_issues']: trend_icon = "📈"
+    elif m_issues and not data['f_issues']: trend_icon = "📉"
+    
+    color = GREEN
+    if m_issues: color = RED if any(x in m_issues for x in ["FOG","WINTER","VIS","TSRA","XWIND","TAILWIND(>10kt)"]) else AMBER
+    elif data['f_issues']: color = AMBER
+    
+    since_text = f" since {hazard_since:%H%M}Z" if m_issues and hazard_since is not None else ""
+    return {"color": color, "trend": trend_icon, "m_issues": m_issues, "since": since_text, "xw": cur_xw, "rwy_text": f"RWY {rwy_name}",
+            "metar_alert": {"type": "/".join(m_issues), "since": since_text, "hex": "primary" if color == RED else "secondary"} if m_issues else None,
+            "taf_alert": {"type": "+".join(data['f_issues']), "time": data['f_time'], "hex": "secondary"} if data['f_issues'] else None}
+
+ALERT_FEED_LENGTH = 30   # Cycle changes kept for the sidebar feed
+
+def alert_severity(alert):
+    return (alert['hex'] == "primary", len(re.split(r"[/+]", alert['type'])))
+
+class AlertBoard:
+    # metar/taf alert dicts for one set of view settings, patched in place as stations are re-assessed. Each station's
+    # assessment is keyed on what it was computed from, so a cycle where a station's reports, forecast window and trend are
+    # unchanged reuses it untouched, and every alert that appears, clears or escalates is recorded as a cycle change.
+    def __init__(self, key=None):
+        self.key, self.version = key, None
+        self.assessed, self.metar, self.taf, self.seen = {}, {}, {}, set()
+        self.changes, self.feed = [], collections.deque(maxlen=ALERT_FEED_LENGTH)
+        self.lock = threading.Lock()  # Held by whoever is running a pass; the board may be shared between sessions
+
+    def begin(self, version):
+        # Start a pass over the stations; changes are only reported once a previous pass exists to diff against
+        self.first_pass, self.version, self.seen, self.changes = self.version is None, version, set(), []
+
+    def assess(self, iata, info, data, xw_threshold, issues_then=None, hazard_since=None):
+        self.seen.add(iata)
+        inputs = (data['status'], data['raw_m'], data['raw_t'], tuple(data['f_issues']), data['f_time'], issues_then, hazard_since)
+        cached = self.assessed.get(iata)
+        if cached and cached[0] == inputs: return cached[1]
+        a = assess_station(iata, info, data, xw_threshold, issues_then, hazard_since)
+        self.assessed[iata] = (inputs, a)
+        self.patch(iata, "METAR", self.metar, a['metar_alert'])
+        self.patch(iata, "TAF", self.taf, a['taf_alert'])
+        return a
+
+    def end(self, stamp=None):
+        # Stations that dropped out of the pass (no data this cycle) clear their alerts; the pass's changes go to the feed, newest first
+        for iata in [iata for iata in self.assessed if iata not in self.seen]:
+            del self.assessed[iata]
+            self.patch(iata, "METAR", self.metar, None)
+            self.patch(iata, "TAF", self.taf, None)
+        changes = [] if self.first_pass else self.changes
+        self.feed.extendleft((stamp, *c) for c in reversed(changes))
+        return changes
+
+    def patch(self, iata, kind, alerts, alert):
+        old = alerts.get(iata)
+        if alert is None:
+            if old is None: return
+            del alerts[iata]
+            change = "CLEARED"
+        else:
+            alerts[iata] = alert
+            if old is None: change = "NEW"
+            elif alert_severity(alert) > alert_severity(old): change = "ESCALATED"
+            else: return
+        self.changes.append((iata, kind, change, (alert or old)['type']))
+
+def handover_text(display_time, horizon_hours, metar_alerts, taf_alerts, shift_events=()):
+    h_txt = f"HANDOVER {display_time}Z | SCAN WINDOW: {horizon_hours}H\n" + "="*50 + "\n"
+    for i_ata, d_met in metar_alerts.items(): h_txt += f"{i_ata}: NOW {d_met['type']}{d_met['since']}\n"
+    for i_ata, d_taf in taf_alerts.items(): h_txt += f"{i_ata}: {d_taf['type']} ({d_taf['time']})\n"
+    if shift_events:
+        h_txt += "-"*50 + f"\nLAST {HANDOVER_WINDOW_HOURS}H:\n" + "".join(f"{t:%H%M}Z {i_ata} {what}\n" for t, i_ata, what in shift_events)
+    return h_txt
+
+def leg_risk(bits, cancelled):
+    # Schedule-wide AT RISK/CAUTION per leg from flight_flags bits (the HUD card also folds in the live METAR for imminent legs)
+    return np.select([np.asarray(cancelled, dtype=bool), (bits & HZ_AT_RISK) > 0, bits > 0], ["CANC", "AT RISK", "CAUTION"], "SCHED")
+
+
+# 5. HEADLESS BATCH
+def ops_picture(snapshot, table, airports, schedule, ops_date, horizon_hours, xw_threshold, history=None, now=None):
+    # The HUD's network picture for one ops date, without any UI: per-station status, alerts, per-leg risk and handover text
+    now = now or datetime.now(timezone.utc)
+    weather = process_weather_for_horizon(table, horizon_hours, xw_threshold, now)
+    day = schedule[schedule['DATE_OBJ'] == ops_date] if not schedule.empty and 'DATE_OBJ' in schedule.columns else pd.DataFrame()
+    index = ScheduleIndex(day) if not day.empty else None
+    stations = {k: v for k, v in airports.items() if k in index.stations} if index and index.stations else {k: v for k, v in airports.items() if not v['alt_only']}
+    trends = history.trends(history.window(), xw_threshold, now) if history else {}
+
+    picture, metar_alerts, taf_alerts = {}, {}, {}
+    for iata, info in stations.items():
+        data = weather.get(iata)
+        if not data: continue
+        a = assess_station(iata, info, data, xw_threshold, *trends.get(iata, (None, None)))
+        if a['metar_alert']: metar_alerts[iata] = a['metar_alert']
+        if a['taf_alert']: taf_alerts[iata] = a['taf_alert']
+        picture[iata] = {"status": data['status'], "color": a['color'], "trend": a['trend'], "metar": a['m_issues'], "since": a['since'].strip(),
+                         "forecast": data['f_issues'], "forecast_time": data['f_time'], "xwind": a['xw'], "runway": a['rwy_text'],
+                         "raw_metar": data['raw_m'], "raw_taf": data['raw_t']}
+
+    legs = []
+    for frame, stn_col, time_col in ((index.arrivals, 'ARR', 'STA'), (index.departures, 'DEP', 'STD')) if index else ():
+        if frame is None: continue
+        bits = table.leg_flags(frame, stn_col, f'{time_col}_TS', xw_threshold, index.owner)
+        legs.append(pd.DataFrame({"DATE": frame['DATE_OBJ'], "FLT": frame['FLT'], "DEP": frame['DEP'].astype(str), "ARR": frame['ARR'].astype(str),
+                                  "KIND": stn_col, "TIME": frame[time_col], "STATION": frame[stn_col].astype(str),
+                                  "HAZARD": ["+".join(label for bit, label in HZ_LABELS if b & bit) for b in bits], "RISK": leg_risk(bits, frame['CANC'])}))
+    flights = pd.concat(legs, ignore_index=True) if legs else pd.DataFrame(columns=["DATE", "FLT", "DEP", "ARR", "KIND", "TIME", "STATION", "HAZARD", "RISK"])
+    events = history.events(history.window(), xw_threshold, now - timedelta(hours=HANDOVER_WINDOW_HOURS)) if history else []
+    return {"ops_date": ops_date.isoformat(), "generated_at": now.isoformat(), "weather_version": snapshot.version,
+            "weather_fetched_at": snapshot.fetched_at.isoformat() if snapshot.fetched_at else None,
+            "changed_stations": sorted(snapshot.changed) if snapshot.changed is not None else None,
+            "stations": picture, "metar_alerts": metar_alerts, "taf_alerts": taf_alerts, "flights": flights,
+            "handover": handover_text(now.strftime("%H:%M"), horizon_hours, metar_alerts, taf_alerts, events)}
+
+def write_picture(picture, out_dir):
+    # <out>/<ops date>/: snapshot.json (stations + alerts), alerts.csv, flights.csv, handover.txt
+    path = os.path.join(out_dir, picture['ops_date'])
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "snapshot.json"), "w") as f:
+        json.dump({k: v for k, v in picture.items() if k not in ("flights", "handover")}, f, indent=1, default=str)
+    alerts = [("METAR", iata, a['type'], a['since'].strip()) for iata, a in picture['metar_alerts'].items()]
+    alerts += [("TAF", iata, a['type'], a['time']) for iata, a in picture['taf_alerts'].items()]
+    pd.DataFrame(alerts, columns=["KIND", "IATA", "TYPE", "TIME"]).to_csv(os.path.join(path, "alerts.csv"), index=False)
+    picture['flights'].to_csv(os.path.join(path, "flights.csv"), index=False)
+    with open(os.path.join(path, "handover.txt"), "w") as f: f.write(picture['handover'])
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless network hazard snapshot")
+    parser.add_argument("--date", action="append", type=date.fromisoformat, help="ops date (YYYY-MM-DD); repeat for several, default today UTC")
+    parser.add_argument("--schedule", default=SCHEDULE_FILE, help="schedule export CSV")
+    parser.add_argument("--out", default="hud_out", help="output directory")
+    parser.add_argument("--horizon", type=int, choices=(6, 12, 24), default=6, help="scan window in hours")
+    parser.add_argument("--xw", type=int, default=25, help="crosswind limit (kt)")
+    parser.add_argument("--offline", action="store_true", help=f"use the last saved {SNAPSHOT_FILE} instead of fetching")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    airports, missing = load_network(AirportDB.load())
+    if missing: print(f"⚠️ No airport/runway data for: {', '.join(missing)}", file=sys.stderr)
+    history = WeatherHistory(airports)
+    snapshot = WeatherSnapshot.load() or WeatherSnapshot()
+    if not (args.offline and snapshot.stations):
+        bundle = get_raw_weather_master(airports, snapshot.stations)
+        snapshot = WeatherSnapshot(snapshot.version + 1, datetime.now(timezone.utc), bundle, changed_stations(snapshot.stations, bundle))
+        snapshot.save()
+        history.append(snapshot)
+    schedule, schedule_hash = pd.DataFrame(), None
+    if os.path.exists(args.schedule):
+        with open(args.schedule, "rb") as f: raw = f.read()
+        schedule_hash = hashlib.sha1(raw).hexdigest()
+        schedule = load_schedule(raw, schedule_hash)
+    table = HazardTable(snapshot.stations, airports)
+    for ops_date in args.date or [datetime.now(timezone.utc).date()]:
+        picture = ops_picture(snapshot, table, airports, schedule, ops_date, args.horizon, args.xw, history)
+        path = write_picture(picture, args.out)
+        print(f"{ops_date}: {len(picture['metar_alerts'])} METAR / {len(picture['taf_alerts'])} TAF alerts, {len(picture['flights'])} legs -> {path}")
+    print(f"done in {time.perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())